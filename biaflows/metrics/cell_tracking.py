@@ -0,0 +1,155 @@
+# Native Cell Tracking Challenge measures for the object tracking (ObjTrk) metrics, equivalent to SEGMeasure
+# (Ulman et al., Nature Methods 2017)
+
+import numpy as np
+
+from .segmentation import label_overlap, overlap_iou
+
+
+def seg_measure(ref_data, res_data):
+    """SEG measure: mean, over the reference objects of all frames, of their Jaccard index with the segmented
+    object covering more than half of them (0 if there is no such object). NaN if there is no reference object.
+
+    Parameters
+    ----------
+    ref_data: ndarray
+        Reference label image, one frame per index of the first axis (e.g. T, Z, Y, X)
+    res_data: ndarray
+        Segmented label image (same shape as ref_data)
+    """
+    total, n_objects = 0.0, 0
+    for ref_frame, res_frame in zip(ref_data, res_data):
+        overlap = label_overlap(ref_frame, res_frame)
+        # |R & S| > 0.5 |R| can hold for at most one segmented object S
+        matched = overlap.intersection > 0.5 * overlap.true_areas[overlap.true_index]
+        total += np.sum(overlap_iou(overlap)[matched])
+        n_objects += overlap.true_labels.size
+    return total / n_objects if n_objects > 0 else np.nan
+
+
+# Weights of the graph operations of the TRA measure: vertex splitting (NS), false negative vertex (FN), false
+# positive vertex (FP), edge deletion (ED), edge addition (EA) and edge semantics change (EC)
+AOGM_WEIGHTS = {"NS": 5.0, "FN": 10.0, "FP": 1.0, "ED": 1.0, "EA": 1.5, "EC": 1.0}
+
+
+def read_tracks(fname):
+    """Reads a Cell Tracking Challenge track file (one 'L B E P' line per track: label, first frame, last frame
+    and parent label, 0 if none) as an integer array with one row per track"""
+    return np.loadtxt(fname, dtype=np.int64, ndmin=2).reshape(-1, 4)
+
+
+def _track_graph(vertices, tracks, n_labels):
+    # Edges (source code, target code, is parent link) of the tracking graph whose vertices are the (frame, label)
+    # codes frame * n_labels + label. Consecutive vertices of a label are linked, as well as the last vertex of a
+    # parent and the first vertex of its children (parents are given by the track file).
+    frames, labels = vertices // n_labels, vertices % n_labels
+    order = np.lexsort((frames, labels))
+    vertices, labels = vertices[order], labels[order]
+    same_track = labels[1:] == labels[:-1]
+    sources, targets = [vertices[:-1][same_track]], [vertices[1:][same_track]]
+
+    present, first = np.unique(labels, return_index=True)
+    last = np.append(first[1:], labels.size) - 1
+    children = tracks[(tracks[:, 3] > 0) & np.isin(tracks[:, 0], present) & np.isin(tracks[:, 3], present)]
+    sources.append(vertices[last[np.searchsorted(present, children[:, 3])]])
+    targets.append(vertices[first[np.searchsorted(present, children[:, 0])]])
+    is_parent_link = np.repeat([False, True], [sources[0].size, sources[1].size])
+    return np.concatenate(sources), np.concatenate(targets), is_parent_link
+
+
+def _expand_matches(edge, res_vertices, match_res, match_ref, *columns):
+    # Replaces every (edge, result vertex) by one row per reference vertex matched with the result vertex
+    # (match_res sorted), rows of unmatched vertices are dropped. Extra columns are repeated along.
+    start = np.searchsorted(match_res, res_vertices, side="left")
+    count = np.searchsorted(match_res, res_vertices, side="right") - start
+    row = np.repeat(np.arange(edge.size), count)
+    position = np.arange(row.size) - np.repeat(np.cumsum(count) - count, count) + np.repeat(start, count)
+    return (edge[row],) + tuple(column[row] for column in columns) + (match_ref[position],)
+
+
+def aogm(ref_data, ref_tracks, res_data, res_tracks, weights=None):
+    """Acyclic oriented graph matching (AOGM) cost of transforming the result tracking graph into the reference
+    one, and the cost of creating the reference graph from scratch (empty result).
+
+    Reference and result vertices (objects of a frame) are matched if the result object covers more than half
+    of the reference object. Result vertices matched with k > 1 reference vertices are split (k - 1 splitting
+    operations), unmatched reference/result vertices are false negatives/positives. A result edge is kept if it
+    links vertices matched with both ends of a reference edge (semantics change if the reference edge is a
+    parent link and not the result edge or vice versa), deleted otherwise. Reference edges without such a result
+    edge are added.
+
+    Parameters
+    ----------
+    ref_data: ndarray
+        Reference label image, one frame per index of the first axis (e.g. T, Z, Y, X)
+    ref_tracks: ndarray
+        Reference tracks (see read_tracks)
+    res_data: ndarray
+        Result label image (same shape as ref_data)
+    res_tracks: ndarray
+        Result tracks (see read_tracks)
+    weights: dict|None
+        Weights of the operations (by default, AOGM_WEIGHTS)
+
+    Returns
+    -------
+    cost: float
+        AOGM cost
+    empty_cost: float
+        Cost of creating the reference graph
+    """
+    weights = AOGM_WEIGHTS if weights is None else weights
+    n_labels = int(max(ref_data.max(initial=0), res_data.max(initial=0))) + 1
+    ref_vertices, res_vertices, match_ref, match_res = list(), list(), list(), list()
+    for t, (ref_frame, res_frame) in enumerate(zip(ref_data, res_data)):
+        overlap = label_overlap(ref_frame, res_frame)
+        matched = overlap.intersection > 0.5 * overlap.true_areas[overlap.true_index]
+        ref_vertices.append(t * n_labels + overlap.true_labels.astype(np.int64))
+        res_vertices.append(t * n_labels + overlap.pred_labels.astype(np.int64))
+        match_ref.append(ref_vertices[-1][overlap.true_index[matched]])
+        match_res.append(res_vertices[-1][overlap.pred_index[matched]])
+    ref_vertices, res_vertices = np.concatenate(ref_vertices), np.concatenate(res_vertices)
+    match_ref, match_res = np.concatenate(match_ref), np.concatenate(match_res)
+
+    # Vertex operations (a reference vertex is matched at most once)
+    n_matches = np.unique(match_res, return_counts=True)[1]
+    ns = np.sum(n_matches - 1)
+    fn = ref_vertices.size - match_ref.size
+    fp = res_vertices.size - n_matches.size
+
+    # Map result edges to pairs of reference vertices through the matches of both ends
+    ref_src, ref_dst, ref_parent = _track_graph(ref_vertices, ref_tracks, n_labels)
+    res_src, res_dst, res_parent = _track_graph(res_vertices, res_tracks, n_labels)
+    order = np.argsort(match_res, kind="stable")
+    match_res, match_ref = match_res[order], match_ref[order]
+    edge, mapped_src = _expand_matches(np.arange(res_src.size), res_src, match_res, match_ref)
+    edge, mapped_src, mapped_dst = _expand_matches(edge, res_dst[edge], match_res, match_ref, mapped_src)
+
+    n_vertex_codes = np.int64(n_labels) * (ref_data.shape[0] + 1)
+    ref_codes = ref_src * n_vertex_codes + ref_dst
+    ref_order = np.argsort(ref_codes)
+    ref_codes = ref_codes[ref_order]
+    pos = np.searchsorted(ref_codes, mapped_src * n_vertex_codes + mapped_dst)
+    found = pos < ref_codes.size
+    found[found] = ref_codes[pos[found]] == (mapped_src * n_vertex_codes + mapped_dst)[found]
+    ref_edge = ref_order[pos[found]]
+
+    covered = np.zeros(ref_src.size, dtype=bool)
+    covered[ref_edge] = True
+    kept = np.zeros(res_src.size, dtype=bool)
+    kept[edge[found]] = True
+    ed = np.count_nonzero(~kept)
+    ea = np.count_nonzero(~covered)
+    ec = np.count_nonzero(res_parent[edge[found]] != ref_parent[ref_edge])
+
+    cost = weights["NS"] * ns + weights["FN"] * fn + weights["FP"] * fp \
+        + weights["ED"] * ed + weights["EA"] * ea + weights["EC"] * ec
+    empty_cost = weights["FN"] * ref_vertices.size + weights["EA"] * ref_src.size
+    return cost, empty_cost
+
+
+def tra_measure(ref_data, ref_tracks, res_data, res_tracks):
+    """TRA measure: 1 - min(AOGM, AOGM_0) / AOGM_0 where AOGM_0 is the cost of creating the reference tracking
+    graph from scratch (NaN if the reference is empty). See aogm for the parameters."""
+    cost, empty_cost = aogm(ref_data, ref_tracks, res_data, res_tracks)
+    return 1 - min(cost, empty_cost) / empty_cost if empty_cost > 0 else np.nan
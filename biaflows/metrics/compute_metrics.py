@@ -4,6 +4,11 @@
 # problemclass:     Problem class (6 character string, see below)
 # tmpfolder:        A temporary folder required for some metric computation
 # extra_params:     A list of possible extra parameters required by some of the metrics (passed as extra arguments)
+#                   backend: "native" (default) or "external" to use the compiled binaries where available
+#                   iou_thresholds: IoU thresholds of the ObjSeg mean average precision (default: 0.5 to 0.95)
+#                   n_threads: number of threads of the LndDet per-class distance queries and of the TreTrc/LooTrc
+#                              NetMets distance queries (default: 1)
+#                   export_obj: also write the TreTrc/LooTrc networks as OBJ files in tmpfolder (default: False)
 #
 # Returns:
 #  metrics_dict: Metric entries
@@ -23,14 +28,12 @@
 import os
 import re
 import shutil
+import subprocess
+import threading
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 
-from skimage import measure
-from sklearn.metrics import f1_score
-from sklearn.metrics import accuracy_score
-from sklearn.metrics import precision_score
-from sklearn.metrics import recall_score
-from scipy import ndimage, stats
 from scipy.spatial import cKDTree
 import pandas as pd
 from biaflows import *
@@ -39,41 +42,187 @@ from .img_to_xml import *
 from .img_to_seq import *
 from .swc2obj import *
 from .skl2obj import *
-from .netmets_obj import netmets_obj
+from .obj_io import write_obj
+from .netmets_obj import netmets_obj, NWT
+from .segmentation import canonical_labels, dice_coefficient, average_hausdorff_distance, label_overlap, overlap_iou, \
+    overlap_fraction, match_scores, average_precision_records
+from .pixel_classification import confusion_matrix_from_tiff, classification_metrics
+from .label_groups import coordinates_by_label, label_slice
+from .point_matching import detection_performance
+from .particle_tracking import tracking_performance
+from .cell_tracking import seg_measure, tra_measure, read_tracks
+from .result_cache import MetricCache, DEFAULT_CACHE_SIZE
 from ..helpers.util import get_ome_metadata
 
+# Metric engines (extra parameter 'backend'): in-process implementation or external binaries
+BACKEND_NATIVE = "native"
+BACKEND_EXTERNAL = "external"
 
-def computemetrics_batch(infiles, reffiles, problemclass, tmpfolder, verbose=True, **extra_params):
+# Point matching and particle tracking jars (external backend) and the driver running a jar several times
+# in a single JVM (see bin/JarBatchRunner.java)
+DETECTION_PERFORMANCE_JAR = "/usr/bin/DetectionPerformance.jar"
+TRACKING_PERFORMANCE_JAR = "/usr/bin/TrackingPerformance.jar"
+JAR_BATCH_RUNNER = "/usr/bin/JarBatchRunner.java"
+
+
+def computemetrics_batch(infiles, reffiles, problemclass, tmpfolder, verbose=True, n_jobs=1, executor=None,
+                         cache_dir=None, cache_max_size=DEFAULT_CACHE_SIZE, **extra_params):
     """Runs compute metrics for all pairs of in and ref files.
     Metrics and parameters values are returned in a dictionary mapping the metrics and parameters names with
     a list of respective values (as many as pair of files).
+
+    Pairs are processed one after another unless `n_jobs` is not 1 (-1 for as many processes as cores) or an
+    `executor` (a `concurrent.futures.Executor`) is given. In this case, each pair gets its own scratch
+    sub-folder of `tmpfolder`. Metrics computed by a jar (see `_uses_jar`) are computed for all the pairs in a
+    single JVM (or in `n_jobs` JVMs) unless an `executor` is given. In any case, values are returned in the
+    order of the input pairs. With `verbose=False`, output is only suppressed for pairs evaluated in the main
+    thread or in worker processes, not by the threads of a `ThreadPoolExecutor`.
+
+    If a `cache_dir` is given, the metrics of every pair are stored in this folder (see `MetricCache`, at most
+    `cache_max_size` bytes) and only the pairs whose files, problem class, extra parameters or library version
+    changed since they were cached are computed again.
     """
     metric_results = dict()
     param_results = dict()
-    for infile, reffile in zip(infiles, reffiles):
-        metrics, params = computemetrics(infile, reffile, problemclass, tmpfolder, verbose=verbose, **extra_params)
-
-        def extend_list_dict(all_dict, curr_dict):
-            for metric_name, metric_value in curr_dict.items():
-                all_dict[metric_name] = all_dict.get(metric_name, []) + [metric_value]
-
+    if cache_dir is None:
+        outputs = _computemetrics_pairs(infiles, reffiles, problemclass, tmpfolder, verbose, n_jobs, executor, extra_params)
+    else:
+        cache = MetricCache(cache_dir, max_size=cache_max_size)
+        keys = [cache.key(infile, reffile, problemclass, extra_params) for infile, reffile in zip(infiles, reffiles)]
+        outputs = [cache.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if len(missing) > 0:
+            computed = _computemetrics_pairs([infiles[i] for i in missing], [reffiles[i] for i in missing],
+                                             problemclass, tmpfolder, verbose, n_jobs, executor, extra_params)
+            for i, output in zip(missing, computed):
+                cache.put(keys[i], output)
+                outputs[i] = output
+
+    def extend_list_dict(all_dict, curr_dict):
+        for metric_name, metric_value in curr_dict.items():
+            all_dict[metric_name] = all_dict.get(metric_name, []) + [metric_value]
+
+    for metrics, params in outputs:
         extend_list_dict(metric_results, metrics)
         extend_list_dict(param_results, params)
 
     return metric_results, param_results
 
 
-def computemetrics(infile, reffile, problemclass, tmpfolder, verbose=True, **extra_params):
-    # to suppress output
+def _computemetrics_pairs(infiles, reffiles, problemclass, tmpfolder, verbose, n_jobs, executor, extra_params):
+    # (metrics_dict, params_dict) of every pair, in order (see computemetrics_batch for the execution modes)
+    if executor is None and len(infiles) > 1 and _uses_jar(problemclass, extra_params):
+        return _computemetrics_jar_batch(infiles, reffiles, problemclass, tmpfolder, n_jobs, verbose=verbose, **extra_params)
+    elif executor is None and n_jobs == 1:
+        return [computemetrics(infile, reffile, problemclass, tmpfolder, verbose=verbose, **extra_params)
+                for infile, reffile in zip(infiles, reffiles)]
+    tasks = [(infile, reffile, problemclass, os.path.join(tmpfolder, "pair_{}".format(i)), verbose, extra_params)
+             for i, (infile, reffile) in enumerate(zip(infiles, reffiles))]
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None) as pool:
+            return list(pool.map(_computemetrics_in_subfolder, tasks))
+    return list(executor.map(_computemetrics_in_subfolder, tasks))
+
+
+def _computemetrics_in_subfolder(task):
+    # Worker entry point: _computemetrics wipes its tmpfolder, so each pair must have a dedicated one
+    infile, reffile, problemclass, tmpfolder, verbose, extra_params = task
+    os.makedirs(tmpfolder, exist_ok=True)
+    try:
+        return computemetrics(infile, reffile, problemclass, tmpfolder, verbose=verbose, **extra_params)
+    finally:
+        shutil.rmtree(tmpfolder, ignore_errors=True)
+
+
+def _uses_jar(problemclass, extra_params):
+    # True if the metrics of the problem class are computed by one of the performance jars
+    return problemclass in {CLASS_OBJDET, CLASS_PRTTRK} and \
+        extra_params.get("backend", BACKEND_NATIVE) == BACKEND_EXTERNAL
+
+
+def _prepare_jar_run(infile, reffile, problemclass, tmpfolder, gating_dist):
+    # Converts non null pixels coordinates to track files (single time point for ObjDet) and returns the jar,
+    # its arguments and the path of the score file it creates
+    keep_labels = problemclass == CLASS_PRTTRK
+    ref_xml_fname = os.path.join(tmpfolder, "reftracks.xml")
+    tracks_to_xml(ref_xml_fname, img_to_tracks(reffile), keep_labels)
+    in_xml_fname = os.path.join(tmpfolder, "intracks.xml")
+    tracks_to_xml(in_xml_fname, img_to_tracks(infile), keep_labels)
+    res_fname = in_xml_fname + ".score.txt"
+    # a score file left by an interrupted run must not be taken for the result of this one
+    if os.path.isfile(res_fname):
+        os.remove(res_fname)
+    # the last parameter represents the gating distance
+    if problemclass == CLASS_OBJDET:
+        return DETECTION_PERFORMANCE_JAR, [ref_xml_fname, in_xml_fname, str(gating_dist)], res_fname
+    return TRACKING_PERFORMANCE_JAR, ["-r", ref_xml_fname, "-c", in_xml_fname, "-o", res_fname, str(gating_dist)], res_fname
+
+
+def _parse_jar_scores(problemclass, res_fname):
+    # Parses the score file created by the jar
+    with open(res_fname, "r") as f:
+        lines = f.readlines()
+    if problemclass == CLASS_OBJDET:
+        bchmetrics = [line.split(':')[1].strip() for line in lines]
+        metric_names = ["TP", "FN", "FP", "RE", "PR", "F1", "RMSE"]
+    else:
+        bchmetrics = [line.split(':')[0].strip() for line in lines]
+        metric_names = [
+            "PD", "NPSA", "FNPSB", "NRT", "NCT",
+            "JST", "NPT", "NMT", "NST", "NRD",
+            "NCD", "JSD", "NPD", "NMD", "NSD"
+        ]
+    return {name: value for name, value in zip(metric_names, bchmetrics)}
+
+
+def _computemetrics_jar_batch(infiles, reffiles, problemclass, tmpfolder, n_jobs=1, verbose=True, **extra_params):
+    # All pairs are evaluated by the same JVM (or by n_jobs JVMs, each one evaluating a chunk of the pairs) started
+    # with the batch runner. Pairs that the batch runner failed to evaluate are evaluated again with 'java -jar'.
+    gating_dist = extra_params.get("gating_dist", 5)
+    subfolders = [os.path.join(tmpfolder, "pair_{}".format(i)) for i in range(len(infiles))]
+    n_jvms = min(len(infiles), os.cpu_count() if n_jobs < 1 else n_jobs)
+    manifests = [os.path.join(tmpfolder, "jar_batch_{}.tsv".format(i)) for i in range(n_jvms)]
     try:
-        with open(os.path.devnull, "w") as devnull:
-            if not verbose:
-                sys.stderr, sys.stdout = devnull, devnull
-            outputs = _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params)
+        runs = list()
+        for infile, reffile, subfolder in zip(infiles, reffiles, subfolders):
+            os.makedirs(subfolder, exist_ok=True)
+            runs.append(_prepare_jar_run(infile, reffile, problemclass, subfolder, gating_dist))
+
+        jar = runs[0][0]
+        processes = list()
+        for manifest, chunk in zip(manifests, np.array_split(np.arange(len(runs)), n_jvms)):
+            with open(manifest, "w") as f:
+                for i in chunk:
+                    f.write("\t".join(runs[i][1]) + "\n")
+            try:
+                output = None if verbose else subprocess.DEVNULL
+                processes.append(subprocess.Popen(["java", JAR_BATCH_RUNNER, jar, manifest], stdout=output, stderr=output))
+            except OSError:
+                pass  # the pairs of this chunk are evaluated with 'java -jar' below
+        for process in processes:
+            process.wait()
+
+        outputs = list()
+        for jar, args, res_fname in runs:
+            if not os.path.isfile(res_fname):
+                os.system('java -jar ' + jar + ' ' + ' '.join(args) + ('' if verbose else ' > ' + os.devnull + ' 2>&1'))
+            outputs.append((_parse_jar_scores(problemclass, res_fname), {"GATING_DIST": gating_dist}))
+        return outputs
     finally:
-        sys.stdout = sys.__stdout__
-        sys.stderr = sys.__stderr__
-    return outputs
+        for subfolder in subfolders:
+            shutil.rmtree(subfolder, ignore_errors=True)
+        for manifest in manifests:
+            if os.path.isfile(manifest):
+                os.remove(manifest)
+
+
+def computemetrics(infile, reffile, problemclass, tmpfolder, verbose=True, **extra_params):
+    # to suppress output: sys.stdout and sys.stderr are shared by all threads, so they are only redirected (and
+    # then restored to their previous value) in the main thread, output of calls from other threads is kept
+    if verbose or threading.current_thread() is not threading.main_thread():
+        return _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params)
+    with open(os.path.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        return _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params)
 
 
 def get_dimensions(tiff, time=False, channels=False):
@@ -119,13 +268,8 @@ def get_dimensions(tiff, time=False, channels=False):
 
 
 def label_image(img):
-    # Returns label image. If input is already label image, then returns it.
-    hist = np.histogram(img, bins=img.max()+1)[0]
-    # If missing labels (ie. binary image 0-255) or only values 0,1
-    if (hist==0).any() or len(hist) == 2:
-        return measure.label(img > 0)
-    else: # Already label image
-        return img
+    # Returns sequential label image. If input is binary, its connected components are labelled.
+    return canonical_labels(img)
 
 
 def binary_image(img):
@@ -136,23 +280,60 @@ def binary_image(img):
 
 
 def fraction_overlap(gt, out):
-    score = 0
-    cnt = 0
     gt = label_image(gt)
     out = label_image(out)
-    outprops = measure.regionprops(out)
-    for region in measure.regionprops(gt, out):
-        area_gt = region.area
-        outlbls = region.intensity_image.ravel()
-        outlbls = outlbls[np.nonzero(outlbls)]
-        if outlbls.shape[0] > 0:
-            mode = stats.mode(outlbls)
-            lbl_out_maxovl = mode.mode[0]
-            area_out_maxovl = mode.count[0]
-            area_out = outprops[int(lbl_out_maxovl - 1)].area
-            score += min(area_out_maxovl, area_gt) / max(area_out, area_gt)
-        cnt += 1
-    return score / cnt
+    return overlap_fraction(label_overlap(gt, out))
+
+
+def unmatched_voxel_rate(pred, true, gating_dist):
+    # Rate of voxels of both skeletons (union) farther than gating_dist from either skeleton.
+    # Only skeleton voxel coordinates are handled, so that memory scales with skeleton length.
+    pred_idx = np.flatnonzero(pred)
+    true_idx = np.flatnonzero(true)
+    union = np.union1d(pred_idx, true_idx)
+    if union.size == 0:
+        return np.nan
+    unmatched = 0
+    for skl_idx in (pred_idx, true_idx):
+        # voxels of the skeleton itself are at distance 0
+        others = np.setdiff1d(union, skl_idx, assume_unique=True)
+        if others.size == 0:
+            continue
+        if skl_idx.size == 0:
+            unmatched += others.size
+            continue
+        tree = cKDTree(np.column_stack(np.unravel_index(skl_idx, pred.shape)))
+        # neighbours beyond the gating distance are not searched (their distance is returned as inf)
+        dists, _ = tree.query(np.column_stack(np.unravel_index(others, pred.shape)), 1,
+                              distance_upper_bound=np.nextafter(gating_dist, np.inf))
+        unmatched += np.count_nonzero(dists > gating_dist)
+    return unmatched / (2 * union.size)
+
+
+def landmark_errors(pred, true, n_threads=1):
+    # Number of reference and predicted landmarks and mean distance from each predicted landmark to the closest
+    # reference landmark of the same class, for classes 1 to max label. Coordinates are grouped by class once per
+    # image. Classes without reference or predicted landmarks have a NaN error.
+    maxlbl = int(max(np.max(pred), np.max(true)))
+    true_values, true_coords, true_offsets = coordinates_by_label(true)
+    pred_values, pred_coords, pred_offsets = coordinates_by_label(pred)
+
+    def class_error(lbl):
+        coords_true = true_coords[label_slice(true_values, true_offsets, lbl)]
+        coords_pred = pred_coords[label_slice(pred_values, pred_offsets, lbl)]
+        if coords_true.shape[0] == 0 or coords_pred.shape[0] == 0:
+            return coords_true.shape[0], coords_pred.shape[0], np.nan
+        min_dists, _ = cKDTree(coords_true).query(coords_pred, 1)
+        return coords_true.shape[0], coords_pred.shape[0], np.mean(min_dists)
+
+    labels = range(1, maxlbl + 1)
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            per_class = list(executor.map(class_error, labels))
+    else:
+        per_class = [class_error(lbl) for lbl in labels]
+    per_class = np.array(per_class, dtype=np.float64).reshape(-1, 3)
+    return per_class[:, 0], per_class[:, 1], per_class[:, 2]
 
 
 def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
@@ -175,27 +356,35 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         out_file = tiff.TiffFile(infile)
         image_out = np.squeeze(out_file.asarray())
 
-        # Call Visceral (compiled) to compute DICE and average Hausdorff distance
-        os.system("Visceral "+reffile+" "+infile+" -thd 0,00001 -use DICE,AVGDIST -xml "+tmpfolder+"/metrics.xml"+" > nul 2>&1")
-        with open(tmpfolder+"/metrics.xml", "r") as myfile:
-            # Parse returned xml file to extract all value fields
-            data = myfile.read()
-            inds = [m.start() for m in re.finditer("value", data)]
-            bchmetrics = [data[ind+7:data.find('"',ind+7)] for ind in inds]
-
-        if len(bchmetrics) < 2:
-            bchmetrics = [0.0, np.nan]
-
-        metric_names = ["DC", "AHD"]
-        metrics_dict.update({name: value for name, value in zip(metric_names, bchmetrics)})
-        # Remove Visceral output file
-        os.system("rm "+tmpfolder+"/metrics.xml"+" > nul 2>&1")
-
-        metrics_dict["FOVL"] = float(fraction_overlap(image_gt, image_out))
-
-        dsb_metrics = pd.DataFrame(columns=["Image", "Threshold", "F1", "Jaccard", "TP", "FP", "FN", "Official_Score", "Precision", "Recall"], dtype=np.float32)
-        dsb_metrics = compute_af1_results(image_gt, image_out, dsb_metrics, os.path.basename(infile))
-        metrics_dict["mAP"] = dsb_metrics['Official_Score'].mean()
+        # Canonical labels are computed once and shared by all metrics
+        labels_gt = canonical_labels(image_gt)
+        labels_out = canonical_labels(image_out)
+
+        if extra_params.get("backend", BACKEND_NATIVE) == BACKEND_NATIVE:
+            metrics_dict["DC"] = dice_coefficient(labels_gt > 0, labels_out > 0)
+            metrics_dict["AHD"] = average_hausdorff_distance(labels_gt > 0, labels_out > 0)
+        else:
+            # Call Visceral (compiled) to compute DICE and average Hausdorff distance
+            os.system("Visceral "+reffile+" "+infile+" -thd 0,00001 -use DICE,AVGDIST -xml "+tmpfolder+"/metrics.xml"+" > nul 2>&1")
+            with open(tmpfolder+"/metrics.xml", "r") as myfile:
+                # Parse returned xml file to extract all value fields
+                data = myfile.read()
+                inds = [m.start() for m in re.finditer("value", data)]
+                bchmetrics = [data[ind+7:data.find('"',ind+7)] for ind in inds]
+
+            if len(bchmetrics) < 2:
+                bchmetrics = [0.0, np.nan]
+
+            metric_names = ["DC", "AHD"]
+            metrics_dict.update({name: value for name, value in zip(metric_names, bchmetrics)})
+            # Remove Visceral output file
+            os.system("rm "+tmpfolder+"/metrics.xml"+" > nul 2>&1")
+
+        # FOVL and mAP are both derived from the overlap table of the label images
+        overlap = label_overlap(labels_gt, labels_out)
+        metrics_dict["FOVL"] = float(overlap_fraction(overlap))
+        ap_records = average_precision_records(overlap, thresholds=extra_params.get("iou_thresholds"))
+        metrics_dict["mAP"] = ap_records.official_score.mean()
 
     elif problemclass == CLASS_SPTCNT:
 
@@ -213,15 +402,9 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
 
     elif problemclass == CLASS_PIXCLA:
 
-        pred_image = tiff.TiffFile(infile)
-        y_pred = pred_image.asarray().ravel()  # Convert to 1-D array
-        true_image = tiff.TiffFile(reffile)
-        y_true = true_image.asarray().ravel()  # Convert to 1-D array
-
-        metrics_dict["ACC"] = accuracy_score(y_true, y_pred, normalize=True, sample_weight=None)
-        metrics_dict["F1"] = f1_score(y_true, y_pred, labels=None, average='weighted')
-        metrics_dict["PR"] = precision_score(y_true, y_pred, labels=None, average='weighted')
-        metrics_dict["RE"] = recall_score(y_true, y_pred, labels=None, average='weighted')
+        # Accumulate the confusion matrix page by page, all metrics are derived from it
+        cm, _ = confusion_matrix_from_tiff(infile, reffile)
+        metrics_dict.update(classification_metrics(cm))
 
     elif problemclass == CLASS_TRETRC:
   
@@ -234,12 +417,16 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         sigma = gating_dist  # NetMets sigma is set to gating_dist since both concepts are related
         subdiv = 4  # Set to default value
 
-        # Convert skeleton masks to OBJ files
-        swc2obj(reffile, os.path.join(tmpfolder, "GT.obj"))
-        swc2obj(infile,  os.path.join(tmpfolder, "Pred.obj"))
+        # Convert SWC files to networks
+        true_graph = swc2graph(reffile)
+        pred_graph = swc2graph(infile)
+        if extra_params.get("export_obj", False):
+            write_obj(os.path.join(tmpfolder, "GT.obj"), *true_graph)
+            write_obj(os.path.join(tmpfolder, "Pred.obj"), *pred_graph)
 
-        # Call NetMets on OBJ files
-        metres = netmets_obj(os.path.join(tmpfolder, "GT.obj"), os.path.join(tmpfolder, "Pred.obj"), sigma, subdiv)
+        # Call NetMets on the networks
+        metres = netmets_obj(NWT.from_graph(*true_graph), NWT.from_graph(*pred_graph), sigma, subdiv,
+                             n_threads=extra_params.get("n_threads", 1))
 
         metrics_dict["TFNR"] = metres['FNR']
         metrics_dict["TFPR"] = metres['FPR']
@@ -267,16 +454,9 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         True_Data = True_ImFile.asarray()
 
         # First metric is the rate of unmatched voxels between both trees (at a distance > gating_dist)
-        Dst1 = ndimage.distance_transform_edt(Pred_Data==0)
-        Dst2 = ndimage.distance_transform_edt(True_Data==0)
-        indx = np.nonzero(np.logical_or(Pred_Data,True_Data))
-        Dst1_onskl = Dst1[indx]
-        Dst2_onskl = Dst2[indx]
         # the third parameter represents the gating distance
         gating_dist = extra_params.get("gating_dist", 5)
-        unmatched_voxel_rate = (sum(Dst1_onskl > gating_dist)+sum(Dst2_onskl > gating_dist))/(Dst1_onskl.size+Dst2_onskl.size)
-
-        metrics_dict["UVR"] = unmatched_voxel_rate
+        metrics_dict["UVR"] = unmatched_voxel_rate(Pred_Data, True_Data, gating_dist)
         params_dict["GATING_DIST"] = gating_dist
 
         pixel_smp = 3           # Skeleton sampling step is set to 3 to ensure accurate reconstruction
@@ -284,12 +464,16 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         sigma = gating_dist     # NetMets sigma is set to gating_dist since both concepts are related
         subdiv = 4              # Set to default value
 
-        # Convert skeleton masks to OBJ files
-        skl2obj(True_Data,pixel_smp,ZRatio,os.path.join(tmpfolder, "GT.obj"))
-        skl2obj(Pred_Data,pixel_smp,ZRatio,os.path.join(tmpfolder, "Pred.obj"))
+        # Convert skeleton masks to networks
+        true_graph = skl2graph(True_Data,pixel_smp,ZRatio)
+        pred_graph = skl2graph(Pred_Data,pixel_smp,ZRatio)
+        if extra_params.get("export_obj", False):
+            write_obj(os.path.join(tmpfolder, "GT.obj"), *true_graph, vertex_fmt="%i")
+            write_obj(os.path.join(tmpfolder, "Pred.obj"), *pred_graph, vertex_fmt="%i")
 
-        # Call NetMets on OBJ files
-        metres = netmets_obj(os.path.join(tmpfolder, "GT.obj"),os.path.join(tmpfolder, "Pred.obj"),sigma,subdiv)
+        # Call NetMets on the networks
+        metres = netmets_obj(NWT.from_graph(*true_graph),NWT.from_graph(*pred_graph),sigma,subdiv,
+                             n_threads=extra_params.get("n_threads", 1))
 
         metrics_dict["FNR"] = metres['FNR']
         metrics_dict["FPR"] = metres['FPR']
@@ -298,24 +482,18 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         params_dict['SUBDIV'] = subdiv
 
     elif problemclass == CLASS_OBJDET:
-        # Convert non null pixels coordinates to track files (single time point)
-        ref_xml_fname = os.path.join(tmpfolder, "reftracks.xml")
-        tracks_to_xml(ref_xml_fname, img_to_tracks(reffile), False)
-        in_xml_fname = os.path.join(tmpfolder, "intracks.xml")
-        tracks_to_xml(in_xml_fname, img_to_tracks(infile), False)
-
-        # Call point matching metric code
-        # the third parameter represents the gating distance
         gating_dist = extra_params.get("gating_dist", 5)
-        #os.system('java -jar bin/win/DetectionPerformance.jar ' + ref_xml_fname + ' ' + in_xml_fname + ' ' + str(gating_dist))
-        os.system('java -jar /usr/bin/DetectionPerformance.jar ' + ref_xml_fname + ' ' + in_xml_fname + ' ' + str(gating_dist))
-
-        # Parse *.score.txt file created automatically in tmpfolder
-        with open(in_xml_fname+".score.txt", "r") as f:
-            bchmetrics = [line.split(':')[1].strip() for line in f.readlines()]
-
-        metric_names = ["TP", "FN", "FP", "RE", "PR", "F1", "RMSE"]
-        metrics_dict.update({name: value for name, value in zip(metric_names, bchmetrics)})
+        if extra_params.get("backend", BACKEND_NATIVE) == BACKEND_NATIVE:
+            # Every non null pixel is a detection, detections are matched within each time point
+            _, ref_points = img_to_points(reffile)
+            _, in_points = img_to_points(infile)
+            metrics_dict.update(detection_performance(ref_points, in_points, gating_dist))
+        else:
+            # Call point matching metric code
+            #os.system('java -jar bin/win/DetectionPerformance.jar ' + ref_xml_fname + ' ' + in_xml_fname + ' ' + str(gating_dist))
+            jar, args, res_fname = _prepare_jar_run(infile, reffile, problemclass, tmpfolder, gating_dist)
+            os.system('java -jar ' + jar + ' ' + ' '.join(args))
+            metrics_dict.update(_parse_jar_scores(problemclass, res_fname))
         params_dict["GATING_DIST"] = gating_dist
 
     elif problemclass == CLASS_LNDDET:
@@ -325,126 +503,93 @@ def _computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
         True_ImFile = tiff.TiffFile(reffile)
         True_Data = True_ImFile.asarray()
 
-        # Initialize metrics arrays
-        maxlbl = max(np.max(Pred_Data), np.max(True_Data))
-        N_REF = np.zeros([maxlbl])
-        N_PRED = np.zeros([maxlbl])
-        MRE = np.zeros([maxlbl], dtype='float')
-
-        # Per class loop
-        for i in range(maxlbl):
-            coords_True = np.argwhere(True_Data == (i+1))
-            coords_Pred = np.argwhere(Pred_Data == (i+1))
-            min_dists, min_dist_idx = cKDTree(coords_True).query(coords_Pred, 1)
-            N_REF[i] = coords_True.shape[0]
-            N_PRED[i] = coords_Pred.shape[0]
-            MRE[i] = np.mean(min_dists)
+        N_REF, N_PRED, MRE = landmark_errors(Pred_Data, True_Data, n_threads=extra_params.get("n_threads", 1))
 
         metrics_dict['NREF'] = np.sum(N_REF)
         metrics_dict['NPRED'] = np.sum(N_PRED)
-        metrics_dict['MRE'] = np.mean(MRE)
+        metrics_dict['MRE'] = np.nanmean(MRE) if np.any(~np.isnan(MRE)) else np.nan
         
     elif problemclass == CLASS_PRTTRK:
-        # Convert non null pixels coordinates to track files
-        ref_xml_fname = os.path.join(tmpfolder, "reftracks.xml")
-        tracks_to_xml(ref_xml_fname, img_to_tracks(reffile), True)
-        in_xml_fname = os.path.join(tmpfolder, "intracks.xml")
-        tracks_to_xml(in_xml_fname, img_to_tracks(infile), True)
-        res_fname = in_xml_fname + ".score.txt"
-
-        # Call tracking metric code
         gating_dist = extra_params.get("gating_dist", 5)
-        # the fourth parameter represents the gating distance
-        os.system('java -jar /usr/bin/TrackingPerformance.jar -r ' + ref_xml_fname + ' -c ' + in_xml_fname + ' -o ' + res_fname + ' ' + str(gating_dist))
-
-        # Parse the output file created automatically in tmpfolder
-        with open(res_fname, "r") as f:
-            bchmetrics = [line.split(':')[0].strip() for line in f.readlines()]
-
-        metric_names = [
-            "PD", "NPSA", "FNPSB", "NRT", "NCT",
-            "JST", "NPT", "NMT", "NST", "NRD",
-            "NCD", "JSD", "NPD", "NMD", "NSD"
-        ]
-        metrics_dict.update({name: value for name, value in zip(metric_names, bchmetrics)})
+        if extra_params.get("backend", BACKEND_NATIVE) == BACKEND_NATIVE:
+            # Non null pixels are the detections of the track given by their label
+            ref_labels, ref_points = img_to_points(reffile)
+            in_labels, in_points = img_to_points(infile)
+            metrics_dict.update(tracking_performance(ref_labels, ref_points, in_labels, in_points, gating_dist))
+        else:
+            # Call tracking metric code
+            jar, args, res_fname = _prepare_jar_run(infile, reffile, problemclass, tmpfolder, gating_dist)
+            os.system('java -jar ' + jar + ' ' + ' '.join(args))
+            metrics_dict.update(_parse_jar_scores(problemclass, res_fname))
         params_dict["GATING_DIST"] = gating_dist
 
     elif problemclass == CLASS_OBJTRK:
-
-        # Convert the data into the Cell Tracking Challenge format
-        ctc_gt_folder = os.path.join(tmpfolder, "01_GT")
-        ctc_gt_seg = os.path.join(ctc_gt_folder, "SEG")
-        ctc_gt_tra = os.path.join(ctc_gt_folder, "TRA")
-        ctc_res_folder = os.path.join(tmpfolder, "01_RES")
-        os.mkdir(ctc_gt_folder)
-        os.mkdir(ctc_gt_seg)
-        os.mkdir(ctc_gt_tra)
-        os.mkdir(ctc_res_folder)
-
-        # Read metadata from reference image (OME-TIFF)
         # for 'ObjTrk', infile and reffile are tuples
         ref_imgfile, ref_txtfile = reffile
         in_imgfile, in_txtfile = infile
 
+        # Read metadata from reference image (OME-TIFF)
         img = tiff.TiffFile(ref_imgfile)
         T, Z, Y, X = get_dimensions(img, time=True)
 
-        # Convert image stack to image sequence (1 image per time point)
-        img_to_seq(ref_imgfile, ctc_gt_seg, "man_seg", X, Y, Z, T)
-        img_to_seq(ref_imgfile, ctc_gt_tra, "man_track", X, Y, Z, T)
-        img_to_seq(in_imgfile, ctc_res_folder, "mask", X, Y, Z, T)
+        if extra_params.get("backend", BACKEND_NATIVE) == BACKEND_NATIVE:
+            ref_data = img.asarray().reshape((T, Z, Y, X))
+            in_data = tiff.TiffFile(in_imgfile).asarray().reshape((T, Z, Y, X))
+            metrics_dict["SEG"] = seg_measure(ref_data, in_data)
+            metrics_dict["TRA"] = tra_measure(ref_data, read_tracks(ref_txtfile), in_data, read_tracks(in_txtfile))
+        else:
+            metrics_dict.update(_ctc_measures(reffile, infile, tmpfolder, (T, Z, Y, X)))
 
-        # Copy the track text files into the created folders
-        shutil.copy2(ref_txtfile, os.path.join(ctc_gt_tra, "man_track.txt"))
-        shutil.copy2(in_txtfile, os.path.join(ctc_res_folder, "res_track.txt"))
-
-        # Run the evaluation routines
-        measure_fname = os.path.join(tmpfolder, "measures.txt")
-        os.system("/usr/bin/SEGMeasure " + tmpfolder + " 01 >> " + measure_fname)
-        os.system("/usr/bin/TRAMeasure " + tmpfolder + " 01 >> " + measure_fname)
-
-        # Parse the output file with the measured scores
-        with open(measure_fname, "r") as f:
-            bchmetrics = list()
-            for line in f.readlines():
-                if ":" not in line:
-                    raise ValueError("Error when computing ObjTrk metrics: '{}'".format(line.strip()))
-                bchmetrics.append(line.split(':')[1].strip())
+    return metrics_dict, params_dict
 
-        metric_names = ["SEG", "TRA"]
-        metrics_dict.update({name: value for name, value in zip(metric_names, bchmetrics)})
 
-    return metrics_dict, params_dict
+def _ctc_measures(reffile, infile, tmpfolder, dims):
+    # Converts the data into the Cell Tracking Challenge format and runs the SEG and TRA evaluation routines
+    ref_imgfile, ref_txtfile = reffile
+    in_imgfile, in_txtfile = infile
+    T, Z, Y, X = dims
+    ctc_gt_folder = os.path.join(tmpfolder, "01_GT")
+    ctc_gt_seg = os.path.join(ctc_gt_folder, "SEG")
+    ctc_gt_tra = os.path.join(ctc_gt_folder, "TRA")
+    ctc_res_folder = os.path.join(tmpfolder, "01_RES")
+    os.mkdir(ctc_gt_folder)
+    os.mkdir(ctc_gt_seg)
+    os.mkdir(ctc_gt_tra)
+    os.mkdir(ctc_res_folder)
+
+    # Convert image stack to image sequence (1 image per time point)
+    # (both reference sequences share a single read of the reference stack)
+    img_to_seqs(ref_imgfile, [(ctc_gt_seg, "man_seg"), (ctc_gt_tra, "man_track")], X, Y, Z, T)
+    img_to_seq(in_imgfile, ctc_res_folder, "mask", X, Y, Z, T)
+
+    # Copy the track text files into the created folders
+    shutil.copy2(ref_txtfile, os.path.join(ctc_gt_tra, "man_track.txt"))
+    shutil.copy2(in_txtfile, os.path.join(ctc_res_folder, "res_track.txt"))
+
+    # Run the evaluation routines
+    measure_fname = os.path.join(tmpfolder, "measures.txt")
+    os.system("/usr/bin/SEGMeasure " + tmpfolder + " 01 >> " + measure_fname)
+    os.system("/usr/bin/TRAMeasure " + tmpfolder + " 01 >> " + measure_fname)
+
+    # Parse the output file with the measured scores
+    with open(measure_fname, "r") as f:
+        bchmetrics = list()
+        for line in f.readlines():
+            if ":" not in line:
+                raise ValueError("Error when computing ObjTrk metrics: '{}'".format(line.strip()))
+            bchmetrics.append(line.split(':')[1].strip())
+
+    metric_names = ["SEG", "TRA"]
+    return {name: value for name, value in zip(metric_names, bchmetrics)}
 
 
 # Following methods have been copied from
 # https://github.com/carpenterlab/2019_caicedo_dsb/blob/master/evaluation.py
 def intersection_over_union(ground_truth, prediction):
-    # Count objects
-    true_objects = len(np.unique(ground_truth))
-    pred_objects = len(np.unique(prediction))
-    
-    # Compute intersection
-    h = np.histogram2d(ground_truth.flatten(), prediction.flatten(), bins=(true_objects,pred_objects))
-    intersection = h[0]
-    
-    # Area of objects
-    area_true = np.histogram(ground_truth, bins=true_objects)[0]
-    area_pred = np.histogram(prediction, bins=pred_objects)[0]
-    
-    # Calculate union
-    area_true = np.expand_dims(area_true, -1)
-    area_pred = np.expand_dims(area_pred, 0)
-    union = area_true + area_pred - intersection
-    
-    # Exclude background from the analysis
-    intersection = intersection[1:,1:]
-    union = union[1:,1:]
-    
-    # Compute Intersection over Union
-    union[union == 0] = 1e-9
-    IOU = intersection/union
-    
+    # Dense IoU matrix (reference objects x predicted objects) built from the sparse overlap table
+    overlap = label_overlap(ground_truth, prediction)
+    IOU = np.zeros((overlap.true_labels.size, overlap.pred_labels.size))
+    IOU[overlap.true_index, overlap.pred_index] = overlap_iou(overlap)
     return IOU
 
 def measures_at(threshold, IOU):
@@ -460,32 +605,23 @@ def measures_at(threshold, IOU):
     
     TP, FP, FN = np.sum(true_positives), np.sum(false_positives), np.sum(false_negatives)
     
-    f1 = 2*TP / (2*TP + FP + FN + 1e-9)
-    official_score = TP / (TP + FP + FN + 1e-9)
-
-    precision = TP / (TP + FP + 1e-9)
-    recall = TP / (TP + FN + 1e-9)
+    f1, official_score, precision, recall = match_scores(TP, FP, FN)
     
     return f1, TP, FP, FN, official_score, precision, recall
 
 # Compute Average Precision for all IoU thresholds
-def compute_af1_results(ground_truth, prediction, results, image_name):
+def compute_af1_results(ground_truth, prediction, results=None, image_name=None, thresholds=None):
+    # Scores at all thresholds are computed at once, the data frame is only built at the end
+    # (appended to results if given)
     ground_truth = label_image(ground_truth)
     prediction = label_image(prediction)
-
-    # Compute IoU    
-    IOU = intersection_over_union(ground_truth, prediction)
-    if IOU.shape[0] > 0:
-        jaccard = np.max(IOU, axis=0).mean()
-    else:
-        jaccard = 0.0
-    
-    # Calculate F1 score at all thresholds
-    for t in np.arange(0.5, 1.0, 0.05):
-        f1, tp, fp, fn, os, prec, rec = measures_at(t, IOU)
-        res = {"Image": image_name, "Threshold": t, "F1": f1, "Jaccard": jaccard, 
-               "TP": tp, "FP": fp, "FN": fn, "Official_Score": os, "Precision": prec, "Recall": rec}
-        row = len(results)
-        results.loc[row] = res
-        
-    return results
+    records = average_precision_records(label_overlap(ground_truth, prediction), thresholds=thresholds)
+
+    image_results = pd.DataFrame({
+        "Image": image_name, "Threshold": records.threshold, "F1": records.f1, "Jaccard": records.jaccard,
+        "TP": records.tp, "FP": records.fp, "FN": records.fn, "Official_Score": records.official_score,
+        "Precision": records.precision, "Recall": records.recall
+    }, columns=["Image", "Threshold", "F1", "Jaccard", "TP", "FP", "FN", "Official_Score", "Precision", "Recall"])
+    if results is None:
+        return image_results
+    return pd.concat([results, image_results], ignore_index=True)
@@ -3,14 +3,40 @@
 
 import tifffile as tiff
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-# Convert the tracking results saved in an OME-TIFF image to a sequence of images
-def img_to_seq(fname, out_dir, template,X,Y,Z,T):
-    img = tiff.TiffFile(fname)
+
+def _frame_reader(img, X, Y, Z, T):
+    # Returns a function reading the (Z, Y, X) frame of a time point. Frames are read from their pages when
+    # every page is a (Y, X) plane or a whole frame, from the whole (flattened) stack otherwise.
+    pages = img.pages
+    if len(pages) == T * Z and all(int(page.size) == Y * X for page in pages):
+        return lambda t: img.asarray(key=range(t * Z, (t + 1) * Z)).reshape((Z, Y, X))
+    if len(pages) == T and all(int(page.size) == Z * Y * X for page in pages):
+        return lambda t: img.asarray(key=t).reshape((Z, Y, X))
     img_data = img.asarray().ravel()
-    index = 0
-    offset = Z*Y*X
-    for t in range(T):
-        with tiff.TiffWriter(os.path.join(out_dir, template + '{0:03d}.tif'.format(t))) as frame:
-            frame.save(img_data[index:index+offset].reshape((Z,Y,X)))
-        index += offset
+    offset = Z * Y * X
+    return lambda t: img_data[t * offset:(t + 1) * offset].reshape((Z, Y, X))
+
+
+def img_to_seqs(fname, targets, X, Y, Z, T, n_threads=4):
+    # Convert the tracking results saved in an OME-TIFF image to one or more sequences of images, each target
+    # being a (out_dir, template) tuple. The stack is read once, one frame at a time, and frames are written by
+    # a pool of threads (at most 2 * n_threads frames are waiting to be written).
+    with tiff.TiffFile(fname) as img, ThreadPoolExecutor(max_workers=n_threads) as executor:
+        read_frame = _frame_reader(img, X, Y, Z, T)
+        pending = deque()
+        for t in range(T):
+            frame = read_frame(t)
+            for out_dir, template in targets:
+                if len(pending) >= 2 * n_threads:
+                    pending.popleft().result()
+                pending.append(executor.submit(tiff.imwrite, os.path.join(out_dir, template + '{0:03d}.tif'.format(t)), frame))
+        for future in pending:
+            future.result()
+
+
+# Convert the tracking results saved in an OME-TIFF image to a sequence of images
+def img_to_seq(fname, out_dir, template, X, Y, Z, T, n_threads=4):
+    img_to_seqs(fname, [(out_dir, template)], X, Y, Z, T, n_threads=n_threads)
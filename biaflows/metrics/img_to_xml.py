@@ -3,36 +3,55 @@
 #          Romain Mormont <rmormont@uliege.be>, 2021
 
 import numpy as np
-from collections import defaultdict
+from collections import namedtuple
 from biaflows.helpers.util import imread
+from .label_groups import group_by_label
 
 
-def img_to_tracks(fname):
-    # Convert the tracking results saved in an OME-TIFF image to a dictionary of tracks
+# Columnar table of tracks: sorted track labels and the coordinates (t, x, y, z arrays) of all detections, sorted
+# by track. The detections of track labels[i] are at indices offsets[i] to offsets[i+1] (excluded).
+TrackTable = namedtuple("TrackTable", ["labels", "offsets", "t", "x", "y", "z"])
+
+
+def img_to_points(fname):
+    # Labels and (T, X, Y, Z) coordinates of the non null pixels of an OME-TIFF image (missing dimensions are 0)
     img_data, order, _ = imread(fname, return_order=True)
-    track_dict = defaultdict(list)
-    where = np.where(img_data > 0)
+    where = np.nonzero(img_data)
     order_idx = {d: i for i, d in enumerate(order)}
-    for val, point in zip(img_data[where], zip(*where)):
-        track_dict[val].append([(point[order_idx.get(d, -1)] if d in order_idx else 0) for d in "TXYZ"])
-    return track_dict
+    points = np.zeros((where[0].size, 4), dtype=np.int64)
+    for i, d in enumerate("TXYZ"):
+        if d in order_idx:
+            points[:, i] = where[order_idx[d]]
+    return img_data[where], points
 
 
-def tracks_to_xml(fname, track_dict, keep_labels):
-    # Convert the dictionary of tracks to the XML format used in the Particle Tracking Challenge
+def points_to_tracks(labels, points):
+    # Group (T, X, Y, Z) points by track label (points of a track keep their order)
+    values, order, offsets = group_by_label(labels)
+    points = points[order]
+    return TrackTable(labels=values, offsets=offsets, t=points[:, 0], x=points[:, 1], y=points[:, 2], z=points[:, 3])
+
+
+def img_to_tracks(fname):
+    # Convert the tracking results saved in an OME-TIFF image to a table of tracks
+    return points_to_tracks(*img_to_points(fname))
+
+
+def tracks_to_xml(fname, tracks, keep_labels):
+    # Convert the table of tracks to the XML format used in the Particle Tracking Challenge
+    detections = ['<detection t=\"{}\" x=\"{}\" y=\"{}\" z=\"{}\"/>\n'.format(*point) for point in zip(
+        tracks.t.tolist(), tracks.x.tolist(), tracks.y.tolist(), tracks.z.tolist()
+    )]
+    if keep_labels:
+        particles = ['<particle>\n' + ''.join(detections[start:end]) + '</particle>\n'
+                     for start, end in zip(tracks.offsets[:-1], tracks.offsets[1:])]
+    else:
+        particles = ['<particle>\n' + detection + '</particle>\n' for detection in detections]
+
     with open(fname, "w") as f:
         f.write('<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"no\"?>\n')
         f.write('<root>\n')
         f.write('<TrackContestISBI2012 SNR=\"1\" density=\"low\" scenario=\"vesicle\">\n')
-
-        for track in track_dict:
-            if keep_labels: f.write('<particle>\n')
-            for point in track_dict[track]:
-                if not keep_labels: f.write('<particle>\n')
-                f.write('<detection t=\"'+str(point[0])+'\" x=\"'+str(point[1])+'\" y=\"'+str(point[2])+'\" z=\"'+str(point[3])+'\"/>\n')
-                if not keep_labels: f.write('</particle>\n')
-            if keep_labels: f.write('</particle>\n')
-
+        f.write(''.join(particles))
         f.write('</TrackContestISBI2012>\n')
         f.write('</root>\n')
-		
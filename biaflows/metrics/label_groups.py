@@ -0,0 +1,57 @@
+# Grouping of array positions by label value (sort once, then slice)
+
+import numpy as np
+
+
+def group_by_label(labels):
+    """Group the positions of a 1D array of labels by label value.
+
+    Parameters
+    ----------
+    labels: ndarray
+        1D array of labels
+
+    Returns
+    -------
+    values: ndarray
+        Sorted distinct label values
+    order: ndarray
+        Positions sorted by label (original order is kept for equal labels)
+    offsets: ndarray
+        The positions having label values[i] are order[offsets[i]:offsets[i+1]]
+    """
+    order = np.argsort(labels, kind="stable")
+    values, starts = np.unique(labels[order], return_index=True)
+    return values, order, np.append(starts, labels.size)
+
+
+def coordinates_by_label(img):
+    """Coordinates of the non-zero voxels of a label image grouped by label. Non-zero voxels are extracted once.
+
+    Parameters
+    ----------
+    img: ndarray
+        Label image
+
+    Returns
+    -------
+    values: ndarray
+        Sorted non-zero label values
+    coords: ndarray
+        Voxel coordinates (one row per voxel, one column per dimension of img) sorted by label, in row-major
+        order for a given label
+    offsets: ndarray
+        The coordinates of label values[i] are coords[offsets[i]:offsets[i+1]]
+    """
+    flat = np.flatnonzero(img)
+    values, order, offsets = group_by_label(img.ravel()[flat])
+    coords = np.column_stack(np.unravel_index(flat[order], img.shape))
+    return values, coords, offsets
+
+
+def label_slice(values, offsets, label):
+    """Slice of the grouped positions having the given label (empty slice if absent)"""
+    i = np.searchsorted(values, label)
+    if i < values.size and values[i] == label:
+        return slice(offsets[i], offsets[i + 1])
+    return slice(0, 0)
@@ -1,4 +1,3 @@
-import struct
 import numpy as np
 import os
 import math
@@ -6,6 +5,7 @@ import scipy as sp
 import scipy.spatial
 import scipy.signal
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 
 class vertex:
     def __init__(self, x, y, z, e_out, e_in):
@@ -35,8 +35,26 @@ class linesegment:
             pc.append(self.p[0] + v * (i/n))
         return pc
 
+#return the points sampling all the line segments (p0[i], p1[i]) at the specified spacing, in a single array operation
+#(same points as linesegment.pointcloud, segment after segment)
+def sample_segments(p0, p1, spacing):
+    v = p1 - p0
+    n = np.ceil(np.sqrt(np.sum(v ** 2, axis=1)) / spacing).astype(np.int64)  #number of intervals of each segment
+    counts = np.where(n == 0, 2, n + 1)                                     #degenerate segments give both end points
+    seg = np.repeat(np.arange(n.size), counts)                              #segment of each sample point
+    i = np.arange(seg.size) - np.repeat(np.cumsum(counts) - counts, counts) #index of each sample point in its segment
+    frac = i / np.maximum(n, 1)[seg]
+    return p0[seg] + v[seg] * frac[:, np.newaxis]
+
 class NWT:
-    def __init__(self, filename):        
+    #the network is stored in arrays:
+    # vertices: (nv, 3) array of vertex positions
+    # edge_vertices: (ne, 2) array of the indices of the starting and ending vertex of each edge
+    # edge_offsets, edge_points: the points defining edge i (between its vertices) are edge_points[edge_offsets[i]:edge_offsets[i+1]]
+    def __init__(self, filename=None):
+        if filename is None:                                            #empty network (see from_arrays)
+            self.set_arrays(np.zeros((0, 3)), np.zeros((0, 2), dtype=np.intp), np.zeros(1, dtype=np.intp), np.zeros((0, 3)))
+            return
         [_, fext] = os.path.splitext(filename)                          #get the file extension so that we know the file type
         if fext == ".nwt":                                              #if the file extension is NWT
             self.load_nwt(filename)                                     #load a NWT file
@@ -45,110 +63,146 @@ class NWT:
         else:                                                           #otherwise raise an exception
             raise ValueError("file type is unsupported as a network")
 
-    def load_nwt(self, filename):        
-        fid = open(filename, "rb")                                      #open a binary file for reading
-        self.header = fid.read(14).decode("utf-8")                      #load the header
-        self.desc = fid.read(58).decode("utf-8")                        #load the description
-        nv = struct.unpack("I", fid.read(4))[0]                         #load the number of vertices and edges
-        ne = struct.unpack("I", fid.read(4))[0]
-
-        self.v = []                                                     #create an empty list to store the vertices        
-        for _ in range(nv):                                             #iterate across all vertices
-            p = np.fromfile(fid, np.float32, 3)                         #read the vertex position
-            E = np.fromfile(fid, np.uint32, 2)                          #read the number of edges
-            e_out = np.fromfile(fid, np.uint32, E[0])                   #read the indices of the outgoing edges
-            e_in = np.fromfile(fid, np.uint32, E[1])                    #read the indices of the incoming edges
-            v = vertex(p[0], p[1], p[2], e_out, e_in)                   #create a vertex
-            self.v.append(v)
-
-        self.e = []                                                     #create an empty array to store the edges        
-        for _ in range(ne):                                             #iterate over all edges            
-            v = np.fromfile(fid, np.uint32, 2)                          #load the vertex indices that this edge connects            
-            npts = struct.unpack("I", fid.read(4))[0]                   #read the number of points defining this edge            
-            pv = np.fromfile(fid, np.float32, 4*npts)                   #read the array of points            
-            p = [(pv[i],pv[i+1]) for i in range(0,npts,2)]              #conver the point values to an array of 4-element tuples            
-            self.e.append(edge(v[0], v[1], p))                          #create and append the edge to the edge list
-
-    def load_obj(self, filename):        
-        fid = open(filename, "r")                                       #open the file for reading        
-        vertices = []                                                   #create an array of vertices
-        lines = []                                                      #create an array of lines
-        for line in fid:                                                #for each line in the file
-            elements = line.split(" ")                                  #split it into token elements            
-            if elements[0] == "v":                                      #if the element is a vertex               
-                c = [float(i) for i in elements[1:]]                    #get the point coordinates                
-                vertices.append(c)                                      #add the coordinates to the vertex list            
-            if elements[0] == "l":                                      #if the element is a line                
-                idx = [int(i) for i in elements[1:]]                    #get the indices for the points that make up the line                
-                lines.append(idx)                                       #add this line to the line list
-
-        self.header = "nwtfileformat "                                  #assign a header and description
+    @classmethod
+    def from_arrays(cls, vertices, edge_vertices, edge_offsets, edge_points):
+        network = cls()
+        network.set_arrays(vertices, edge_vertices, edge_offsets, edge_points)
+        return network
+
+    #network whose edges are straight lines between points (lines: (n, 2) array of 0-based point indices), as it
+    #would be loaded from an OBJ file with these points and lines (see skl2graph and swc2graph)
+    @classmethod
+    def from_graph(cls, points, lines):
+        lines = np.asarray(lines, dtype=np.intp).reshape(-1, 2)
+        ends, ends_inv = np.unique(lines, return_inverse=True)         #the end points of the lines are the vertices of the network
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return cls.from_arrays(points[ends], ends_inv.reshape(-1, 2), np.zeros(lines.shape[0] + 1, dtype=np.intp), np.zeros((0, 3)))
+
+    def set_arrays(self, vertices, edge_vertices, edge_offsets, edge_points):
+        self.header = "nwtfileformat "
+        self.desc = "File generated from arrays"
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.edge_vertices = np.asarray(edge_vertices, dtype=np.intp).reshape(-1, 2)
+        self.edge_offsets = np.asarray(edge_offsets, dtype=np.intp)
+        self.edge_points = np.asarray(edge_points, dtype=np.float64).reshape(-1, 3)
+
+    def load_nwt(self, filename):
+        with open(filename, "rb") as fid:                               #read the whole binary file in a single buffer
+            buffer = fid.read()
+        words = np.frombuffer(buffer, dtype=np.uint32, offset=72)       #all the following fields are 4 bytes long (uint32 or float32)
+        floats = words.view(np.float32)
+        nv, ne = int(words[0]), int(words[1])                           #number of vertices and edges
+
+        pos = 2
+        vertex_pos = np.empty(nv, dtype=np.intp)
+        for i in range(nv):                                             #vertex: position (3 floats), number of outgoing and incoming edges, edge indices
+            vertex_pos[i] = pos
+            pos += 5 + int(words[pos + 3]) + int(words[pos + 4])
+        vertices = floats[vertex_pos[:, np.newaxis] + np.arange(3)]
+
+        edge_pos = np.empty(ne, dtype=np.intp)
+        npts = np.empty(ne, dtype=np.intp)
+        for i in range(ne):                                             #edge: vertex indices, number of points, points (4 floats: position and radius)
+            edge_pos[i] = pos
+            npts[i] = words[pos + 2]
+            pos += 3 + 4 * npts[i]
+        edge_vertices = words[edge_pos[:, np.newaxis] + np.arange(2)]
+        edge_offsets = np.concatenate([[0], np.cumsum(npts)])
+        point_pos = np.repeat(edge_pos + 3 - 4 * edge_offsets[:-1], npts) + 4 * np.arange(edge_offsets[-1])
+        edge_points = floats[point_pos[:, np.newaxis] + np.arange(3)]
+
+        self.set_arrays(vertices, edge_vertices, edge_offsets, edge_points)
+        self.header = buffer[:14].decode("utf-8")                       #load the header
+        self.desc = buffer[14:72].decode("utf-8")                       #load the description
+
+    def load_obj(self, filename):
+        with open(filename, "r") as fid:                                #read all the vertex (v) and line (l) records
+            records = fid.read().splitlines()
+        v_records = [r[2:] for r in records if r.startswith("v ")]
+        l_records = [r[2:].split() for r in records if r.startswith("l ")]
+        coords = np.array(" ".join(v_records).split(), dtype=np.float64).reshape(len(v_records), -1)[:, :3] if v_records else np.zeros((0, 3))
+        lengths = np.array([len(r) for r in l_records], dtype=np.intp)
+        indices = np.array([i for r in l_records for i in r], dtype=np.intp) - 1    #OBJ indices start at 1
+
+        first = np.cumsum(lengths) - lengths                            #position of the first and last point of each line
+        last = first + lengths - 1
+        ends, ends_inv = np.unique(np.concatenate([indices[first], indices[last]]), return_inverse=True)
+        edge_vertices = ends_inv.reshape(2, -1).T                       #the end points of the lines are the vertices of the network
+
+        interior = np.ones(indices.size, dtype=bool)                    #the other points define the edges
+        interior[first] = False
+        interior[last] = False
+        edge_offsets = np.concatenate([[0], np.cumsum(np.maximum(lengths - 2, 0))])
+
+        self.set_arrays(coords[ends], edge_vertices, edge_offsets, coords[indices[interior]])
         self.desc = "File generated from OBJ"
-                                                                        #insert the first and last vertex ID for each line into a set
-        vertex_set = set()                                              #create an empty set
-        for line in lines:                                              #for each line in the list of lines
-            vertex_set.add(line[0])                                     #add the first and last vertex to the vertex set (this will remove redundancies)
-            vertex_set.add(line[-1])
-        
-        obj2nwt = dict()                                                #create a new dictionary - will be used to map vertex IDs in the OBJ to IDs in the NWT object
-
-        #create a mapping between OBJ vertex indices and NWT vertex indices
-        vi = 0                                                          #initialize a vertex counter to zero
-        for si in vertex_set:                                           #for each vertex in the set of vertices
-            obj2nwt[si] = vi                                            #assign the mapping
-            vi = vi + 1                                                 #increment the vertex counter
-
-        #iterate through each line (edge), assigning them to their starting and ending vertices
-        v_out = [list() for _ in range(len(vertex_set))]                #create an array of empty lists storing the inlet and outlet edges for each vertex
-        v_in = [list() for _ in range(len(vertex_set))]
-
-        self.e = []                                                     #create an empty list storing the NWT vertex IDs for each edge (inlet and outlet)
-        for li in range(len(lines)):                                    #for each line
-            v0 = obj2nwt[lines[li][0]]                                  #get the NWT index for the starting and ending points (vertices)
-            v1 = obj2nwt[lines[li][-1]]
-
-            v_out[v0].append(li)                                        #add the line index to a list of inlet edges
-            v_in[v1].append(li)                                         #add the line index to a list of outlet edges
 
-            p = []                                                      #create an emptu array of points used to store point positions in the NWT graph
-            for pi in range(1, len(lines[li]) - 1):                     #for each point in the line that is not an end point (vertex)
-                p.append(np.array(vertices[lines[li][pi]-1]))              #add the coordinates for that point as a tuple into the point list
-            self.e.append(edge(v0, v1, p))                              #create an edge, specifying the inlet and outlet vertices and all defining points
-
-        #for each vertex in the set, create a NWT vertex containing all of the necessary edge information
-        self.v = []                                                     #create an empty list to store the vertices
-        for s in vertex_set:                                            #for each OBJ vertex in the vertex set
-            vi = obj2nwt[s]                                             #calculate the corresponding NWT index
-            self.v.append(vertex(vertices[s-1][0], vertices[s-1][1], vertices[s-1][2], v_out[vi], v_in[vi]))    #create a vertex object, consisting of a position and attached edges
+    #list of vertex objects (positions and attached edges)
+    @property
+    def v(self):
+        e_out = [list() for _ in range(self.vertices.shape[0])]
+        e_in = [list() for _ in range(self.vertices.shape[0])]
+        for ei, (v0, v1) in enumerate(self.edge_vertices.tolist()):
+            e_out[v0].append(ei)
+            e_in[v1].append(ei)
+        return [vertex(p[0], p[1], p[2], e_out[vi], e_in[vi]) for vi, p in enumerate(self.vertices)]
+
+    #list of edge objects (vertex indices and defining points)
+    @property
+    def e(self):
+        return [edge(v0, v1, list(self.edge_points[self.edge_offsets[ei]:self.edge_offsets[ei + 1]]))
+                for ei, (v0, v1) in enumerate(self.edge_vertices.tolist())]
 
     #return a set of line segments connecting all points in the network
     def linesegments(self):
-
-        s = []                                                          #create an empty list of line segments
-        for e in self.e:                                                #for each edge in the graph
-            p0 = self.v[e.v[0]].p                                       #load the first point (from the starting vertex)
-
-            for p in e.p:                                               #for each point in the edge
-                p1 = np.array([p[0], p[1], p[2]])                       #get the second point for the line segment
-                s.append(linesegment(p0, p1))                           #append the line segment to the list of line segments
-                p0 = p1                                                 #update the start point for the next segment to the end point of this one
-            
-            p1 = self.v[e.v[1]].p                                       #load the last point (from the ending vertex)
-            s.append(linesegment(p0, p1))                               #append the last line segment for this edge to the list
-        return s
+        return [linesegment(p0, p1) for p0, p1 in zip(*self.segments())]
+
+    #return the end points (two arrays of shape (n, 3)) of all the line segments connecting all points in the network
+    def segments(self):
+        npts = np.diff(self.edge_offsets)
+        lengths = npts + 2                                              #each edge is a polyline from its starting to its ending vertex
+        starts = np.cumsum(lengths) - lengths
+        polylines = np.empty((int(np.sum(lengths)), 3))
+        polylines[starts] = self.vertices[self.edge_vertices[:, 0]]
+        polylines[starts + lengths - 1] = self.vertices[self.edge_vertices[:, 1]]
+        interior = np.ones(polylines.shape[0], dtype=bool)
+        interior[starts] = False
+        interior[starts + lengths - 1] = False
+        polylines[interior] = self.edge_points
+        valid = np.ones(max(polylines.shape[0] - 1, 0), dtype=bool)     #no segment between the last point of an edge and the first of the next one
+        valid[starts[1:] - 1] = False
+        return polylines[:-1][valid], polylines[1:][valid]
 
     #return a point cloud sampling the centerline of the network at the given spacing
     def pointcloud(self, spacing):
-        ls = self.linesegments()
-        pc = []
-        for l in ls:
-            pc = pc + l.pointcloud(spacing)
-        return pc
+        p0, p1 = self.segments()
+        return sample_segments(p0, p1, spacing)
 
 def gaussian(X, sigma):
     return np.exp(-0.5 * (X ** 2 / sigma ** 2))
 
-def netmets_obj(GTfile,Tfile,sigma,subdiv):
+#distances are only computed up to CUTOFF * sigma, the Gaussian metric of farther points (< 2e-8) is 0 in float32
+CUTOFF = 6
+#number of points of a query chunk (one chunk per task of the thread pool)
+QUERY_CHUNK_SIZE = 65536
+
+#return the (float32) distance from every point to its nearest neighbour in the KD tree, inf beyond upper_bound,
+#the points being queried in chunks on a pool of n_threads threads
+def nearest_distances(tree, points, upper_bound, n_threads=1):
+    dist = np.empty(points.shape[0], dtype=np.float32)
+    def query(start):
+        dist[start:start + QUERY_CHUNK_SIZE] = tree.query(points[start:start + QUERY_CHUNK_SIZE], distance_upper_bound=upper_bound)[0]
+    starts = range(0, points.shape[0], QUERY_CHUNK_SIZE)
+    if n_threads > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(query, starts))
+    else:
+        for start in starts:
+            query(start)
+    return dist
+
+#GTfile and Tfile are network files (NWT or OBJ) or networks already in memory (NWT objects)
+def netmets_obj(GTfile,Tfile,sigma,subdiv,n_threads=1):
 
     #set the input parameters
     #sigma = 10
@@ -158,8 +212,8 @@ def netmets_obj(GTfile,Tfile,sigma,subdiv):
     #subdiv = 4                                                            #fraction of sigma used to sample each network
 
     #load the ground truth and test case networks
-    GT = NWT(GTfile)
-    T = NWT(Tfile)
+    GT = GTfile if isinstance(GTfile, NWT) else NWT(GTfile)
+    T = Tfile if isinstance(Tfile, NWT) else NWT(Tfile)
 
     #generate point clouds representing both networks
     P_T = np.array(T.pointcloud(sigma/subdiv))
@@ -170,12 +224,12 @@ def netmets_obj(GTfile,Tfile,sigma,subdiv):
     T_tree = sp.spatial.cKDTree(P_T)
 
     #query each KD tree to get the corresponding geometric distances
-    [T_dist, _] = GT_tree.query(P_T)
-    [GT_dist, _] = T_tree.query(P_GT)
+    T_dist = nearest_distances(GT_tree, P_T, CUTOFF * sigma, n_threads)
+    GT_dist = nearest_distances(T_tree, P_GT, CUTOFF * sigma, n_threads)
 
     #convert distances to Gaussian metrics
-    T_metric = gaussian(T_dist, sigma)
-    GT_metric = gaussian(GT_dist, sigma)
+    T_metric = gaussian(T_dist, np.float32(sigma))
+    GT_metric = gaussian(GT_dist, np.float32(sigma))
 
     #calculate the TPR and FPR
     #print("FNR = " + str(1 - np.mean(GT_metric)))
@@ -190,6 +244,6 @@ def netmets_obj(GTfile,Tfile,sigma,subdiv):
     #plt.scatter(P_GT[:, 0], P_GT[:, 1], s=sigma, c=GT_metric, cmap = "plasma")
     #plt.show()
 
-    return {'FNR':1 - np.mean(GT_metric), 'FPR':1 - np.mean(T_metric)}
+    return {'FNR':1 - np.mean(GT_metric, dtype=np.float64), 'FPR':1 - np.mean(T_metric, dtype=np.float64)}
 
 
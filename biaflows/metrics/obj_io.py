@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def write_obj(output_path, vertices, lines, vertex_fmt="%s"):
+    """
+    Write a graph as an obj file with only Geometric vertices (v) and Line elements (l), in two bulk calls
+
+    Parameters
+    ----------
+    output_path: str
+        Path for output the obj file
+    vertices: ndarray
+        Vertex coordinates, shape (n, 3)
+    lines: ndarray
+        Line elements as pairs of (0-based) vertex indices, shape (m, 2)
+    vertex_fmt: str
+        Format of a vertex coordinate
+    """
+    with open(output_path, "w") as fid:
+        np.savetxt(fid, np.asarray(vertices).reshape(-1, 3), fmt="v " + " ".join([vertex_fmt] * 3))
+        np.savetxt(fid, np.asarray(lines, dtype=np.int64).reshape(-1, 2) + 1, fmt="l %d %d")
@@ -0,0 +1,142 @@
+# Native particle tracking (PrtTrk) metrics, equivalent to TrackingPerformance.jar
+# (track pairing scores of the ISBI 2012 Particle Tracking Challenge, Chenouard et al., Nature Methods 2014)
+
+import numpy as np
+
+from .label_groups import group_by_label
+from .point_matching import gated_neighbours, sparse_assignment
+
+
+def track_detections(labels, points):
+    """One detection per track and time point (centroid of the track points of this time point).
+
+    Parameters
+    ----------
+    labels: ndarray
+        Track label of every point
+    points: ndarray
+        (T, X, Y, Z) coordinates of every point
+
+    Returns
+    -------
+    tracks: ndarray
+        Track index (in track_labels) of every detection, detections being sorted by track then time point
+    detections: ndarray
+        (T, X, Y, Z) coordinates of every detection
+    track_labels: ndarray
+        Sorted track labels
+    """
+    track_labels, tracks = np.unique(labels, return_inverse=True)
+    tracks = tracks.ravel()
+    if tracks.size == 0:
+        return tracks.astype(np.intp), np.zeros((0, 4), dtype=np.float64), track_labels
+    frames = points[:, 0].astype(np.int64)
+    keys, inverse, counts = np.unique(tracks * (frames.max() + 1) + frames, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    detections = np.column_stack([
+        np.bincount(inverse, weights=points[:, i], minlength=keys.size) / counts for i in range(points.shape[1])
+    ])
+    return (keys // (frames.max() + 1)).astype(np.intp), detections, track_labels
+
+
+def _common_frames(true_tracks, true_frames, pred_tracks, pred_frames, rows, cols):
+    # Number of time points shared by reference track rows[k] and predicted track cols[k]
+    n_frames = int(max(true_frames.max(), pred_frames.max())) + 1
+    true_keys = np.sort(true_tracks.astype(np.int64) * n_frames + true_frames)
+    pred_values, pred_order, pred_offsets = group_by_label(pred_tracks)
+    index = np.searchsorted(pred_values, cols)
+    starts = pred_offsets[index]
+    lengths = pred_offsets[index + 1] - starts
+    # Expand every pair to the detections of its predicted track and look them up in the reference track
+    pair = np.repeat(np.arange(rows.size), lengths)
+    position = np.arange(pair.size) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    keys = rows[pair].astype(np.int64) * n_frames + pred_frames[pred_order[position]]
+    found = np.searchsorted(true_keys, keys)
+    found = (found < true_keys.size) & (true_keys[np.minimum(found, true_keys.size - 1)] == keys)
+    return np.bincount(pair[found], minlength=rows.size)
+
+
+def _ratio(num, den):
+    return num / den if den > 0 else np.nan
+
+
+def tracking_performance(true_labels, true_points, pred_labels, pred_points, gating_dist):
+    """Track pairing scores between reference and predicted tracks.
+
+    The distance between two tracks is the sum, over the time points of both tracks, of the distance between
+    their detections clipped at the gating distance (the gating distance if one track has no detection). Every
+    reference track is paired with a predicted track or with a dummy track (distance: gating distance times
+    track length) so that the total distance is minimal, a predicted track being paired at most once.
+
+    Parameters
+    ----------
+    true_labels: ndarray
+        Track label of every reference point
+    true_points: ndarray
+        (T, X, Y, Z) coordinates of every reference point
+    pred_labels: ndarray
+        Track label of every predicted point
+    pred_points: ndarray
+        (T, X, Y, Z) coordinates of every predicted point
+    gating_dist: float
+        Gating distance
+
+    Returns
+    -------
+    scores: dict
+        PD (pairing distance), NPSA (normalized pairing score alpha), FNPSB (full normalized pairing score beta),
+        NRT/NCT (number of reference/candidate tracks), JST (Jaccard similarity of tracks), NPT/NMT/NST (number
+        of paired/missed/spurious tracks), NRD/NCD (number of reference/candidate detections), JSD (Jaccard
+        similarity of detections), NPD/NMD/NSD (number of paired/missed/spurious detections). Undefined scores
+        are NaN.
+    """
+    true_tracks, true_dets, true_track_labels = track_detections(true_labels, true_points)
+    pred_tracks, pred_dets, pred_track_labels = track_detections(pred_labels, pred_points)
+    n_true, n_pred = true_track_labels.size, pred_track_labels.size
+    pred_lengths = np.bincount(pred_tracks, minlength=n_pred)
+
+    # Detections closer than the gating distance, aggregated by pair of tracks
+    det_rows, det_cols, det_dists = gated_neighbours(true_dets, pred_dets, gating_dist)
+    pair_codes = true_tracks[det_rows].astype(np.int64) * max(n_pred, 1) + pred_tracks[det_cols]
+    pairs, pair_inverse = np.unique(pair_codes, return_inverse=True)
+    pair_inverse = pair_inverse.ravel()
+    rows, cols = pairs // max(n_pred, 1), pairs % max(n_pred, 1)
+    savings = np.bincount(pair_inverse, weights=gating_dist - det_dists, minlength=pairs.size)
+    close_counts = np.bincount(pair_inverse, minlength=pairs.size)
+
+    # Pairing a reference track with a predicted track instead of a dummy track changes its distance by
+    # eps * (|T_pred| - |T_true & T_pred|) - sum over close detections of (eps - d)
+    if pairs.size > 0:
+        common = _common_frames(true_tracks, true_dets[:, 0].astype(np.int64),
+                                pred_tracks, pred_dets[:, 0].astype(np.int64), rows, cols)
+    else:
+        common = np.zeros(0, dtype=np.int64)
+    costs = gating_dist * (pred_lengths[cols] - common) - savings
+    paired = sparse_assignment(rows, cols, costs, n_true, n_pred)
+
+    nrd, ncd = true_tracks.size, pred_tracks.size
+    npt = paired.size
+    npd = int(np.sum(close_counts[paired]))
+    dummy_dist = gating_dist * nrd
+    pairing_dist = dummy_dist + np.sum(costs[paired])
+    spurious = np.ones(n_pred, dtype=bool)
+    spurious[cols[paired]] = False
+    spurious_dist = gating_dist * np.sum(pred_lengths[spurious])
+
+    return {
+        "PD": pairing_dist,
+        "NPSA": 1 - _ratio(pairing_dist, dummy_dist),
+        "FNPSB": _ratio(dummy_dist - pairing_dist, dummy_dist + spurious_dist),
+        "NRT": n_true,
+        "NCT": n_pred,
+        "JST": _ratio(npt, n_true + n_pred - npt),
+        "NPT": npt,
+        "NMT": n_true - npt,
+        "NST": n_pred - npt,
+        "NRD": nrd,
+        "NCD": ncd,
+        "JSD": _ratio(npd, nrd + ncd - npd),
+        "NPD": npd,
+        "NMD": nrd - npd,
+        "NSD": ncd - npd
+    }
@@ -0,0 +1,121 @@
+# Streaming confusion matrix for the pixel classification (PixCla) metrics
+
+import numpy as np
+import tifffile as tiff
+
+
+def update_confusion_matrix(cm, labels, y_true, y_pred):
+    """Accumulate a chunk of pixels into a confusion matrix.
+
+    Parameters
+    ----------
+    cm: ndarray|None
+        Confusion matrix (rows: true classes, columns: predicted classes), None for an empty matrix
+    labels: ndarray|None
+        Sorted class values of the rows/columns of cm
+    y_true: ndarray
+        Reference classes of the chunk pixels
+    y_pred: ndarray
+        Predicted classes of the chunk pixels (same size as y_true)
+
+    Returns
+    -------
+    cm: ndarray
+        Updated confusion matrix (grown if new classes appear in the chunk)
+    labels: ndarray
+        Updated class values
+    """
+    y_true, y_pred = y_true.ravel(), y_pred.ravel()
+    if y_true.dtype == bool:
+        y_true = y_true.view(np.uint8)
+    if y_pred.dtype == bool:
+        y_pred = y_pred.view(np.uint8)
+
+    # Small non-negative integer classes are counted with histograms, other values are sorted
+    hi = None
+    if y_true.size > 0 and y_true.dtype.kind in "ui" and y_pred.dtype.kind in "ui" \
+            and min(y_true.min(), y_pred.min()) >= 0 and max(y_true.max(), y_pred.max()) < 2 ** 16:
+        hi = int(max(y_true.max(), y_pred.max()))
+        y_true, y_pred = y_true.astype(np.intp, copy=False), y_pred.astype(np.intp, copy=False)
+        present = np.bincount(y_true, minlength=hi + 1) + np.bincount(y_pred, minlength=hi + 1)
+        chunk_labels = np.flatnonzero(present)
+    else:
+        chunk_labels = np.union1d(y_true, y_pred)
+
+    if cm is None:
+        cm, labels = np.zeros((chunk_labels.size, chunk_labels.size), dtype=np.int64), chunk_labels
+    else:
+        new_labels = np.union1d(labels, chunk_labels)
+        if new_labels.size > labels.size:
+            grown = np.zeros((new_labels.size, new_labels.size), dtype=np.int64)
+            pos = np.searchsorted(new_labels, labels)
+            grown[np.ix_(pos, pos)] = cm
+            cm, labels = grown, new_labels
+
+    if hi is not None:
+        lut = np.zeros(hi + 1, dtype=np.intp)
+        # only the integer classes of [0, hi] can be chunk values (earlier chunks may hold others)
+        small = labels[(labels >= 0) & (labels <= hi)]
+        small = small[small.astype(np.intp) == small]
+        lut[small.astype(np.intp)] = np.searchsorted(labels, small)
+        true_idx, pred_idx = lut[y_true], lut[y_pred]
+    else:
+        true_idx, pred_idx = np.searchsorted(labels, y_true), np.searchsorted(labels, y_pred)
+    n = labels.size
+    cm += np.bincount(true_idx * n + pred_idx, minlength=n * n).reshape(n, n)
+    return cm, labels
+
+
+def confusion_matrix_from_tiff(infile, reffile):
+    """Confusion matrix between a reference and a predicted class image, read page by page so that only one page
+    of each image is in memory at a time.
+
+    Parameters
+    ----------
+    infile: str
+        Path of the predicted class image (TIFF)
+    reffile: str
+        Path of the reference class image (TIFF)
+
+    Returns
+    -------
+    cm: ndarray
+        Confusion matrix (rows: true classes, columns: predicted classes)
+    labels: ndarray
+        Class values of the rows/columns of cm
+    """
+    cm, labels = None, None
+    with tiff.TiffFile(infile) as pred_image, tiff.TiffFile(reffile) as true_image:
+        pred_pages, true_pages = pred_image.series[0].pages, true_image.series[0].pages
+        if len(pred_pages) == len(true_pages):
+            for pred_page, true_page in zip(pred_pages, true_pages):
+                cm, labels = update_confusion_matrix(cm, labels, true_page.asarray(), pred_page.asarray())
+        else:
+            # different page layouts, pixels can only be paired in the whole arrays
+            cm, labels = update_confusion_matrix(cm, labels, true_image.asarray(), pred_image.asarray())
+    return cm, labels
+
+
+def class_scores(cm):
+    """Per-class precision, recall, F1-score and support (number of reference pixels) from a confusion matrix.
+    Undefined scores (division by zero) are set to 0."""
+    tp = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(support + predicted > 0, 2 * tp / (support + predicted), 0.0)
+    return precision, recall, f1, support
+
+
+def classification_metrics(cm):
+    """Accuracy and support-weighted F1-score, precision and recall from a confusion matrix"""
+    precision, recall, f1, support = class_scores(cm)
+    weights = support / support.sum()
+    return {
+        "ACC": np.trace(cm) / cm.sum(),
+        "F1": np.sum(f1 * weights),
+        "PR": np.sum(precision * weights),
+        "RE": np.sum(recall * weights)
+    }
@@ -0,0 +1,164 @@
+# Native gated point matching for the object detection (ObjDet) metrics, equivalent to DetectionPerformance.jar
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .label_groups import group_by_label
+
+
+def sparse_assignment(rows, cols, costs, n_rows, n_cols):
+    """Minimum cost matching in a sparse bipartite graph. Only edges with a negative cost are worth matching
+    (leaving a node unmatched costs 0). The graph is split into connected components which are solved
+    independently: isolated edges are matched directly and the other components are solved with the Hungarian
+    algorithm on their (small) dense cost matrix.
+
+    Parameters
+    ----------
+    rows: ndarray
+        Row node of every edge
+    cols: ndarray
+        Column node of every edge
+    costs: ndarray
+        Cost of every edge
+    n_rows: int
+        Number of row nodes
+    n_cols: int
+        Number of column nodes
+
+    Returns
+    -------
+    edges: ndarray
+        Indices (in rows/cols/costs) of the matched edges
+    """
+    candidates = np.flatnonzero(np.asarray(costs) < 0)
+    if candidates.size == 0:
+        return candidates
+    rows, cols, costs = rows[candidates], cols[candidates], costs[candidates]
+
+    # Column nodes are numbered after the row nodes in the undirected graph
+    n_nodes = n_rows + n_cols
+    graph = coo_matrix((np.ones(rows.size, dtype=np.int8), (rows, n_rows + cols)), shape=(n_nodes, n_nodes))
+    _, components = connected_components(graph, directed=False)
+
+    matched = list()
+    edge_components = components[rows]
+    _, order, offsets = group_by_label(edge_components)
+    sizes = np.diff(offsets)
+    matched.append(order[offsets[:-1][sizes == 1]])
+
+    for start, end in zip(offsets[:-1][sizes > 1], offsets[1:][sizes > 1]):
+        edges = order[start:end]
+        sub_rows, row_idx = np.unique(rows[edges], return_inverse=True)
+        sub_cols, col_idx = np.unique(cols[edges], return_inverse=True)
+        cost_matrix = np.zeros((sub_rows.size, sub_cols.size), dtype=np.float64)
+        edge_index = np.full((sub_rows.size, sub_cols.size), -1, dtype=np.intp)
+        cost_matrix[row_idx, col_idx] = costs[edges]
+        edge_index[row_idx, col_idx] = edges
+        assigned_rows, assigned_cols = linear_sum_assignment(cost_matrix)
+        assigned = edge_index[assigned_rows, assigned_cols]
+        matched.append(assigned[assigned >= 0])
+
+    return candidates[np.sort(np.concatenate(matched))]
+
+
+def gated_neighbours(true_points, pred_points, gating_dist):
+    """Pairs of reference and predicted points of the same frame closer than the gating distance (strictly).
+
+    Parameters
+    ----------
+    true_points: ndarray
+        Reference points, one row per point (frame index, then spatial coordinates)
+    pred_points: ndarray
+        Predicted points (same columns as true_points)
+    gating_dist: float
+        Gating distance
+
+    Returns
+    -------
+    true_index: ndarray
+        Indices of the reference points of the pairs
+    pred_index: ndarray
+        Indices of the predicted points of the pairs
+    dists: ndarray
+        Distances between the points of the pairs
+    """
+    if true_points.shape[0] == 0 or pred_points.shape[0] == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64)
+
+    # Frames are moved apart along the first axis so that points of different frames are never neighbours
+    frame_step = 2 * gating_dist + 1
+    true_coords = np.asarray(true_points, dtype=np.float64).copy()
+    pred_coords = np.asarray(pred_points, dtype=np.float64).copy()
+    true_coords[:, 0] *= frame_step
+    pred_coords[:, 0] *= frame_step
+
+    neighbours = cKDTree(true_coords).sparse_distance_matrix(cKDTree(pred_coords), gating_dist, output_type="ndarray")
+    neighbours = neighbours[neighbours["v"] < gating_dist]
+    return neighbours["i"].astype(np.intp), neighbours["j"].astype(np.intp), neighbours["v"]
+
+
+def gated_matching(true_points, pred_points, gating_dist):
+    """Optimal one-to-one matching of reference and predicted points of the same frame, two points being
+    matched only if their distance is strictly smaller than the gating distance. The matching minimizes the sum
+    of the distances, unmatched points costing the gating distance.
+
+    Parameters
+    ----------
+    true_points: ndarray
+        Reference points, one row per point (frame index, then spatial coordinates)
+    pred_points: ndarray
+        Predicted points (same columns as true_points)
+    gating_dist: float
+        Gating distance
+
+    Returns
+    -------
+    true_index: ndarray
+        Indices of the matched reference points
+    pred_index: ndarray
+        Indices of the matched predicted points
+    dists: ndarray
+        Distances between the matched points
+    """
+    rows, cols, dists = gated_neighbours(true_points, pred_points, gating_dist)
+    # Matching a pair saves the cost of leaving both points unmatched
+    matched = sparse_assignment(rows, cols, dists - gating_dist, true_points.shape[0], pred_points.shape[0])
+    return rows[matched], cols[matched], dists[matched]
+
+
+def _ratio(num, den):
+    return num / den if den > 0 else np.nan
+
+
+def detection_performance(true_points, pred_points, gating_dist):
+    """Object detection scores from the gated matching of reference and predicted points: true positives (TP),
+    false negatives (FN), false positives (FP), recall (RE), precision (PR), F1-score (F1) and root mean square
+    error of the matched points (RMSE). Undefined scores are NaN.
+
+    Parameters
+    ----------
+    true_points: ndarray
+        Reference points, one row per point (frame index, then spatial coordinates)
+    pred_points: ndarray
+        Predicted points (same columns as true_points)
+    gating_dist: float
+        Gating distance
+    """
+    _, _, dists = gated_matching(true_points, pred_points, gating_dist)
+    tp = dists.size
+    fn = true_points.shape[0] - tp
+    fp = pred_points.shape[0] - tp
+    recall = _ratio(tp, tp + fn)
+    precision = _ratio(tp, tp + fp)
+    return {
+        "TP": tp,
+        "FN": fn,
+        "FP": fp,
+        "RE": recall,
+        "PR": precision,
+        "F1": _ratio(2 * tp, 2 * tp + fn + fp),
+        "RMSE": np.sqrt(np.mean(np.square(dists))) if tp > 0 else np.nan
+    }
@@ -0,0 +1,111 @@
+# On-disk cache of the metrics computed for pairs of output and reference files
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from biaflows import __version__
+
+
+# Default maximum size of a cache folder (bytes)
+DEFAULT_CACHE_SIZE = 2 ** 26
+
+# Size of the blocks read when hashing a file
+HASH_BLOCK_SIZE = 2 ** 20
+
+
+def file_digest(path, hasher=None):
+    """Feeds the content of a file (or of a list of files, in order) to a blake2b hasher and returns it
+
+    Parameters
+    ----------
+    path: str|list
+        Path of the file, or list of paths
+    hasher: hashlib.blake2b|None
+        Hasher to update (a new one if None)
+    """
+    hasher = hashlib.blake2b(digest_size=20) if hasher is None else hasher
+    for fname in ([path] if isinstance(path, str) else path):
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                hasher.update(block)
+        hasher.update(b"\0")
+    return hasher
+
+
+class MetricCache(object):
+    """Cache of the (metrics_dict, params_dict) outputs of computemetrics stored as one file per entry in a folder.
+    Entries are addressed by the content of the files, the problem class, the extra parameters and the library
+    version. When the folder gets larger than max_size bytes, the least recently used entries are evicted.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Cache folder (created if needed)
+    max_size: int
+        Maximum size of the cache folder (bytes)
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, infile, reffile, problemclass, extra_params):
+        """Key of the metrics of a pair of files (see file_digest for the file arguments)"""
+        hasher = hashlib.blake2b(digest_size=20)
+        header = json.dumps([__version__, problemclass, extra_params], sort_keys=True, default=str)
+        hasher.update(header.encode("utf-8") + b"\0")
+        file_digest(infile, hasher)
+        hasher.update(b"\1")
+        file_digest(reffile, hasher)
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        """Cached outputs for the key, None if there is no such entry"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                outputs = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return outputs
+
+    def put(self, key, outputs):
+        """Stores the outputs for the key (atomically, concurrent writers of the same entry are harmless), then
+        evicts the least recently used entries if needed"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used (stored or read) entries until the cache is not larger than max_size"""
+        entries = list()
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
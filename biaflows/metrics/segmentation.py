@@ -0,0 +1,245 @@
+# Native implementation of the object segmentation (ObjSeg) metrics
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+from skimage import measure
+
+
+# Sparse contingency table between two label images. Objects are the non-zero labels (true_labels, pred_labels,
+# sorted) with their areas. Only the non-empty intersections between objects are stored as (true_index,
+# pred_index, intersection) triplets, indices referring to positions in true_labels/pred_labels.
+LabelOverlap = namedtuple("LabelOverlap", [
+    "true_labels", "pred_labels", "true_areas", "pred_areas", "true_index", "pred_index", "intersection"
+])
+
+# Default IoU thresholds of the average precision (0.5, 0.55, ..., 0.95)
+DEFAULT_IOU_THRESHOLDS = np.arange(0.5, 1.0, 0.05)
+
+
+def dice_coefficient(gt, out):
+    """Dice coefficient between two binary masks (0 if both masks are empty)
+
+    Parameters
+    ----------
+    gt: ndarray
+        Reference binary mask
+    out: ndarray
+        Predicted binary mask (same shape as gt)
+    """
+    gt, out = gt.astype(bool), out.astype(bool)
+    total = np.count_nonzero(gt) + np.count_nonzero(out)
+    if total == 0:
+        return 0.0
+    return 2.0 * np.count_nonzero(gt & out) / total
+
+
+def boundary_coordinates(mask):
+    """Coordinates of the voxels of a binary mask that touch the background (or the image border)"""
+    boundary = mask & ~ndimage.binary_erosion(mask)
+    return np.argwhere(boundary)
+
+
+def _directed_average_distance(src, dst, dst_tree):
+    # Voxels of src inside dst are at distance 0, the others have their closest dst voxel on dst boundary
+    outside = np.argwhere(src & ~dst)
+    if outside.shape[0] == 0:
+        return 0.0
+    dists, _ = dst_tree.query(outside, 1)
+    return np.sum(dists) / np.count_nonzero(src)
+
+
+def average_hausdorff_distance(gt, out):
+    """Average Hausdorff distance (in voxels) between two binary masks, i.e. the maximum of both directed
+    average distances (NaN if one of the masks is empty). Nearest neighbours are searched among the boundary
+    voxels only.
+
+    Parameters
+    ----------
+    gt: ndarray
+        Reference binary mask
+    out: ndarray
+        Predicted binary mask (same shape as gt)
+    """
+    gt, out = gt.astype(bool), out.astype(bool)
+    if not gt.any() or not out.any():
+        return np.nan
+    gt_tree = cKDTree(boundary_coordinates(gt))
+    out_tree = cKDTree(boundary_coordinates(out))
+    return max(_directed_average_distance(gt, out, out_tree),
+               _directed_average_distance(out, gt, gt_tree))
+
+
+def _label_inverse(img):
+    # Sorted label values of img and, for each pixel, the index of its value in this list
+    flat = img.ravel()
+    if flat.dtype == bool:
+        flat = flat.view(np.uint8)
+    if flat.dtype.kind in "ui" and flat.size > 0 and flat.min() >= 0 and flat.max() < max(2 ** 16, flat.size):
+        # small non-negative integers: a histogram is cheaper than sorting all pixels
+        if flat.dtype.itemsize >= np.dtype(np.intp).itemsize:
+            flat = flat.astype(np.intp)
+        values = np.flatnonzero(np.bincount(flat))
+        lut = np.zeros(values[-1] + 1, dtype=np.intp)
+        lut[values] = np.arange(values.size)
+        return values, lut[flat]
+    values, inverse = np.unique(flat, return_inverse=True)
+    return values, inverse.ravel()
+
+
+def canonical_labels(img):
+    """Sequential label image (background 0, objects 1 to n) stored in the smallest unsigned integer dtype.
+    An image with a single non-zero value is considered as a binary mask and its connected components are
+    labelled. Otherwise, every distinct non-zero value is an object (values do not have to be contiguous).
+    """
+    values, inverse = _label_inverse(img)
+    is_object = values != 0
+    n_objects = np.count_nonzero(is_object)
+    if n_objects <= 1:
+        labels = measure.label(img > 0)
+        return labels.astype(np.min_scalar_type(labels.max()))
+    ranks = (np.cumsum(is_object) * is_object).astype(np.min_scalar_type(n_objects))
+    return ranks[inverse].reshape(img.shape)
+
+
+def label_overlap(gt, out):
+    """Sparse overlap table between two label images of the same shape (0 is the background). Labels do not
+    have to be contiguous.
+
+    Parameters
+    ----------
+    gt: ndarray
+        Reference label image
+    out: ndarray
+        Predicted label image
+
+    Returns
+    -------
+    overlap: LabelOverlap
+    """
+    true_values, true_inv = _label_inverse(gt)
+    pred_values, pred_inv = _label_inverse(out)
+    n_true, n_pred = true_values.size, pred_values.size
+
+    # Encode each pixel by its (true, pred) pair and count the pairs in a single pass
+    codes = true_inv.astype(np.int64) * n_pred + pred_inv
+    if n_true * n_pred <= 4 * codes.size:
+        counts = np.bincount(codes, minlength=n_true * n_pred)
+        pairs = np.flatnonzero(counts)
+        counts = counts[pairs]
+    else:
+        pairs, counts = np.unique(codes, return_counts=True)
+    true_index, pred_index = pairs // n_pred, pairs % n_pred
+
+    # Remove the background from the objects and from the pairs
+    true_offset = int(true_values[0] == 0)
+    pred_offset = int(pred_values[0] == 0)
+    objects = (true_index >= true_offset) & (pred_index >= pred_offset)
+    return LabelOverlap(
+        true_labels=true_values[true_offset:],
+        pred_labels=pred_values[pred_offset:],
+        true_areas=np.bincount(true_inv, minlength=n_true)[true_offset:],
+        pred_areas=np.bincount(pred_inv, minlength=n_pred)[pred_offset:],
+        true_index=true_index[objects] - true_offset,
+        pred_index=pred_index[objects] - pred_offset,
+        intersection=counts[objects]
+    )
+
+
+def overlap_iou(overlap):
+    """Intersection over union of every overlapping pair of objects of a LabelOverlap table"""
+    union = overlap.true_areas[overlap.true_index] + overlap.pred_areas[overlap.pred_index] - overlap.intersection
+    return overlap.intersection / union
+
+
+def overlap_jaccard(overlap, iou=None):
+    """Mean, over the predicted objects, of their best IoU with a reference object"""
+    if overlap.true_labels.size == 0 or overlap.pred_labels.size == 0:
+        return 0.0
+    iou = overlap_iou(overlap) if iou is None else iou
+    best = np.zeros(overlap.pred_labels.size, dtype=np.float64)
+    np.maximum.at(best, overlap.pred_index, iou)
+    return best.mean()
+
+
+def overlap_matches(overlap, iou, threshold):
+    """Number of true positives, false positives and false negatives when objects are matched if their IoU is
+    strictly greater than the threshold (a reference object is a true positive if it has exactly one match)"""
+    matched = iou > threshold
+    true_matches = np.bincount(overlap.true_index[matched], minlength=overlap.true_labels.size)
+    pred_matches = np.bincount(overlap.pred_index[matched], minlength=overlap.pred_labels.size)
+    tp = np.count_nonzero(true_matches == 1)
+    fp = np.count_nonzero(pred_matches == 0)
+    fn = np.count_nonzero(true_matches == 0)
+    return tp, fp, fn
+
+
+def overlap_fraction(overlap):
+    """Fraction overlap (FOVL): mean, over the reference objects, of min(A_ovl, A_gt) / max(A_out, A_gt) where
+    A_ovl is the area of the intersection with the most overlapping predicted object (smallest label in case of
+    tie) and A_out the area of this object. Reference objects without overlap score 0 (NaN if no reference
+    object)."""
+    n_true = overlap.true_labels.size
+    if n_true == 0:
+        return np.nan
+    # Sort pairs by reference object, then by decreasing intersection and keep the first pair of each object
+    order = np.lexsort((overlap.pred_index, -overlap.intersection, overlap.true_index))
+    true_index = overlap.true_index[order]
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = true_index[1:] != true_index[:-1]
+    best = order[first]
+    area_ovl = overlap.intersection[best]
+    area_gt = overlap.true_areas[overlap.true_index[best]]
+    area_out = overlap.pred_areas[overlap.pred_index[best]]
+    return np.sum(np.minimum(area_ovl, area_gt) / np.maximum(area_out, area_gt)) / n_true
+
+
+def match_scores(tp, fp, fn):
+    """F1, official score (TP / (TP + FP + FN)), precision and recall from match counts (scalars or arrays)"""
+    f1 = 2 * tp / (2 * tp + fp + fn + 1e-9)
+    official_score = tp / (tp + fp + fn + 1e-9)
+    precision = tp / (tp + fp + 1e-9)
+    recall = tp / (tp + fn + 1e-9)
+    return f1, official_score, precision, recall
+
+
+def average_precision_records(overlap, thresholds=None, iou=None):
+    """Match counts and scores at all IoU thresholds in a single pass over the sorted IoU values.
+
+    Parameters
+    ----------
+    overlap: LabelOverlap
+        Overlap table of the reference and predicted label images
+    thresholds: iterable|None
+        IoU thresholds (by default, DEFAULT_IOU_THRESHOLDS)
+    iou: ndarray|None
+        IoU of the overlapping pairs if already computed
+
+    Returns
+    -------
+    records: np.recarray
+        One record per threshold with fields threshold, f1, jaccard, tp, fp, fn, official_score, precision
+        and recall
+    """
+    thresholds = np.asarray(DEFAULT_IOU_THRESHOLDS if thresholds is None else thresholds, dtype=np.float64)
+    iou = overlap_iou(overlap) if iou is None else iou
+    n_true, n_pred = overlap.true_labels.size, overlap.pred_labels.size
+
+    if thresholds.size > 0 and thresholds.min() >= 0.5:
+        # Above 0.5, a reference object matches at most one predicted object (and conversely) so that the
+        # number of true positives is the number of pairs with an IoU greater than the threshold
+        matched_iou = np.sort(iou[iou > 0.5])
+        tp = matched_iou.size - np.searchsorted(matched_iou, thresholds, side="right")
+        fp, fn = n_pred - tp, n_true - tp
+    else:
+        counts = np.array([overlap_matches(overlap, iou, t) for t in thresholds], dtype=np.int64).reshape(-1, 3)
+        tp, fp, fn = counts.T
+
+    f1, official_score, precision, recall = match_scores(tp, fp, fn)
+    jaccard = np.full(thresholds.size, overlap_jaccard(overlap, iou))
+    return np.rec.fromarrays(
+        [thresholds, f1, jaccard, tp, fp, fn, official_score, precision, recall],
+        names=["threshold", "f1", "jaccard", "tp", "fp", "fn", "official_score", "precision", "recall"]
+    )
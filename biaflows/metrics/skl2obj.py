@@ -1,91 +1,49 @@
 import numpy as np
 from skan import csr
+from .obj_io import write_obj
 #Note: requires bleeding edge version of Skan, install with: pip install git+https://github.com/jni/skan
 
-def skl2obj(Skl_np,smp,ZRatio,OBJToExport):
+def skl2graph(Skl_np,smp,ZRatio):
+    # Sample the branches of a skeleton mask every smp voxels: returns the sampled vertices (X, Y, Z*ZRatio)
+    # and the node to node links as pairs of (0-based) vertex indices
 
-    # Analyze skeleton
-    branch_data = csr.summarise(Skl_np)
-    NBranches = branch_data.shape[0]
+    # Analyze skeleton: the voxels of branch i are Brch_vox[Brch_ptr[i]:Brch_ptr[i+1]] (skan path_coordinates)
     skel_obj = csr.Skeleton(Skl_np)
-    Brch_vox = skel_obj.path_coordinates
-    NSkeletons = np.unique(branch_data['skeleton-id']).shape[0]
-
-    # Extract required information on skeleton branches
-    #NBranches = branch_data.shape[0]
-    brclist = skel_obj.paths_list()
-    NBranches = len(brclist)
-    id_0 = np.zeros(NBranches,dtype=int)
-    id_1 = np.zeros(NBranches,dtype=int)
-    for i in range(NBranches):
-        id_0[i] = brclist[i][0]
-        id_1[i] = brclist[i][-1]
-
-    # Parse all nodes to find unique vertices
-    AllNodes = (np.unique([id_0,id_1]))
-    MaxVertexIdx = (np.amax(AllNodes))
-    NVertices = AllNodes.size
-
-    # Over-estimate of total number of segments after skeleton sampling (node to node links)
-    TotSegments = 1
-    for i in range(NBranches):
-        TotSegments = TotSegments + (1+np.floor(Brch_vox(i).shape[0]/smp)).astype(int)
-
-    # Display model information
-    #print("Number of skeletons: %i"%NSkeletons)
-    #print("Number of branches: %i"%NBranches)
-    #print("Number of nodes: %i"%NVertices)
-    #print("Estimated number of segments: %i"%TotSegments)
+    Brch_ptr = np.asarray(skel_obj.paths.indptr, dtype=np.intp)
+    Brch_vox = np.asarray(skel_obj.coordinates)[skel_obj.paths.indices]
+    Vox_XYZ = np.column_stack([Brch_vox[:,2],Brch_vox[:,1],Brch_vox[:,0]*ZRatio]).astype(int)
+    L = np.diff(Brch_ptr)
+    NBranches = L.size
+
+    # Branch end nodes are the unique vertices (sorted by skeleton node id), then come the sampled nodes
+    id_0 = skel_obj.paths.indices[Brch_ptr[:-1]]
+    id_1 = skel_obj.paths.indices[Brch_ptr[1:]-1]
+    _, first_vox, LUTVertices = np.unique(np.concatenate([id_0,id_1]),return_index=True,return_inverse=True)
+    LUTVertices = LUTVertices.ravel()
+    NVertices = first_vox.size
+    first_vox = np.concatenate([Brch_ptr[:-1],Brch_ptr[1:]-1])[first_vox]
+
+    # Sample nodes s = 1..nNodes-2 of every branch, at voxel round(s*(L-1)/(nNodes-1)) of the branch
+    nNodes = 1+L//smp
+    NInner = np.maximum(nNodes-2,0)
+    Brch = np.repeat(np.arange(NBranches),NInner)
+    s = np.arange(Brch.size)-np.repeat(np.cumsum(NInner)-NInner,NInner)+1
+    Inner_vox = Brch_ptr[Brch]+np.round(s*(L[Brch]-1)/(nNodes[Brch]-1)).astype(int)
+    OBJ_Vdata = np.concatenate([Vox_XYZ[first_vox],Vox_XYZ[Inner_vox]])
+
+    # Chain the nodes of every branch (first end, sampled nodes, last end) and link consecutive nodes
+    NChain = NInner+2
+    Chain_start = np.cumsum(NChain)-NChain
+    Chain = np.empty(np.sum(NChain),dtype=int)
+    Chain[Chain_start] = LUTVertices[:NBranches]
+    Chain[Chain_start+NChain-1] = LUTVertices[NBranches:]
+    Chain[np.repeat(Chain_start,NInner)+s] = NVertices+np.arange(Brch.size)
+    Linked = np.ones(max(Chain.size-1,0),dtype=bool)
+    Linked[(Chain_start+NChain-1)[:-1]] = False
+    OBJ_Ldata = np.column_stack([Chain[:-1][Linked],Chain[1:][Linked]])
+
+    return OBJ_Vdata, OBJ_Ldata
 
-    # Build re-indexing LUT
-    LUTVertices = np.zeros([MaxVertexIdx+1,1],dtype=int)
-    for i in range(NVertices):
-        LUTVertices[AllNodes[i]] = i
-
-    # Fill OBJ v-data
-    OBJ_Vdata = np.zeros([TotSegments,3],dtype=int)
-    for i in range(NBranches):
-        OBJ_Vdata[LUTVertices[id_0[i]],0] = Brch_vox(i)[0,2]
-        OBJ_Vdata[LUTVertices[id_0[i]],1] = Brch_vox(i)[0,1]
-        OBJ_Vdata[LUTVertices[id_0[i]],2] = Brch_vox(i)[0,0]*ZRatio
-        OBJ_Vdata[LUTVertices[id_1[i]],0] = Brch_vox(i)[-1,2]
-        OBJ_Vdata[LUTVertices[id_1[i]],1] = Brch_vox(i)[-1,1]
-        OBJ_Vdata[LUTVertices[id_1[i]],2] = Brch_vox(i)[-1,0]*ZRatio
-    cntVertices = NVertices
-
-    # Fill OBJ l-data
-    OBJ_Ldata = np.ones((TotSegments,2),dtype=int)
-    cntSegments = 0
-    for i in range(NBranches):
-        Vox = Brch_vox(i)
-        L = Vox.shape[0]
-        nNodes = (1+np.floor(L/smp)).astype(int)
-        PrevNode = LUTVertices[id_0[i]]+1
-        for s in range(1,nNodes-1):
-            OBJ_Vdata[cntVertices,0] = Vox[np.round(s*(L-1)/(nNodes-1)).astype(int),2]
-            OBJ_Vdata[cntVertices,1] = Vox[np.round(s*(L-1)/(nNodes-1)).astype(int),1]
-            OBJ_Vdata[cntVertices,2] = Vox[np.round(s*(L-1)/(nNodes-1)).astype(int),0]*ZRatio
-            OBJ_Ldata[cntSegments,0] = PrevNode
-            OBJ_Ldata[cntSegments,1] = cntVertices+1
-            PrevNode = cntVertices+1
-            cntVertices = cntVertices + 1
-            cntSegments = cntSegments + 1
-        OBJ_Ldata[cntSegments,0] = PrevNode
-        OBJ_Ldata[cntSegments,1] = LUTVertices[id_1[i]]+1
-        cntSegments = cntSegments + 1
-
-    # Display model statistics
-    #print("Actual number of vertices: %i" %cntVertices)
-    #print("Actual number of segments: %i" %cntSegments)
-
-    with open(OBJToExport, "w") as f:
-        f.write("")
-    f.close()
-    with open(OBJToExport, "a") as f:
-        for i in range(cntVertices):
-            f.write("v %i %i %i\n" %(OBJ_Vdata[i,0],OBJ_Vdata[i,1],OBJ_Vdata[i,2]))
-    f.close()
-    with open(OBJToExport, "a") as f:
-        for i in range(cntSegments):
-            f.write("l %i %i\n" %(OBJ_Ldata[i,0],OBJ_Ldata[i,1]))
-    f.close()
+def skl2obj(Skl_np,smp,ZRatio,OBJToExport):
+    # Sample the branches of a skeleton mask and export them as an OBJ file
+    write_obj(OBJToExport, *skl2graph(Skl_np,smp,ZRatio), vertex_fmt="%i")
@@ -0,0 +1,63 @@
+# Array-backed reader and writer of SWC files
+# See http://www.neuronland.org/NLMorphologyConverter/MorphologyFormats/SWC/Spec.html for the format specification
+
+import numpy as np
+
+
+# One SWC node per record: id, type, coordinates, radius and parent id (-1 for a root)
+SWC_DTYPE = np.dtype([
+    ("id", np.int64), ("type", np.int64), ("x", np.float64), ("y", np.float64), ("z", np.float64),
+    ("radius", np.float64), ("parent", np.int64)
+])
+
+
+def swc_from_table(table):
+    """Structured SWC array (see SWC_DTYPE) from a table with one row per node and the 7 SWC columns"""
+    table = np.asarray(table).reshape(-1, len(SWC_DTYPE.names))
+    swc = np.zeros(table.shape[0], dtype=SWC_DTYPE)
+    for i, name in enumerate(SWC_DTYPE.names):
+        swc[name] = table[:, i]
+    return swc
+
+
+def read_swc(fname):
+    """Reads a SWC file as a structured array (see SWC_DTYPE). Comments (starting with '#') and blank lines are
+    skipped. Lines with extra columns are accepted, the parent id being the last column.
+
+    Parameters
+    ----------
+    fname: str
+        Path of the SWC file
+
+    Returns
+    -------
+    swc: ndarray
+        One record per node, in the order of the file
+    """
+    with open(fname, "r") as f:
+        lines = [line.split("#", 1)[0] for line in f.read().splitlines()]
+    lines = [line for line in lines if line.strip()]
+    n_columns = len(SWC_DTYPE.names)
+    values = " ".join(lines).split()
+    if len(values) != n_columns * len(lines):
+        values = [value for line in lines for value in (lambda s: s[:n_columns - 1] + s[-1:])(line.split())]
+    return swc_from_table(np.array(values, dtype=np.float64).reshape(len(lines), n_columns))
+
+
+def write_swc(fname, swc, header="", fmt="%i %i %.2f %.2f %.2f %.2f %i"):
+    """Writes a structured SWC array (see SWC_DTYPE) as a SWC file, with a single bulk formatting call
+
+    Parameters
+    ----------
+    fname: str
+        Path of the SWC file
+    swc: ndarray
+        One record per node
+    header: str
+        Text written before the nodes (comment lines)
+    fmt: str
+        Format of a node line
+    """
+    with open(fname, "w") as f:
+        f.write(header)
+        np.savetxt(f, swc, fmt=fmt)
@@ -0,0 +1,84 @@
+// Runs the main class of an executable jar several times in a single JVM, one run per line of a manifest file
+// (tab-separated arguments), so that JVM startup and class loading are paid only once.
+//
+// Usage: java JarBatchRunner.java <jar> <manifest>
+//
+// Jars packed with their libraries (Eclipse "jar in jar" loader, e.g. DetectionPerformance.jar) are supported:
+// nested jars listed in Rsrc-Class-Path are extracted to a temporary folder and Rsrc-Main-Class is run.
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStream;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.jar.Attributes;
+import java.util.jar.JarEntry;
+import java.util.jar.JarFile;
+
+public class JarBatchRunner {
+
+    public static void main(String[] args) throws Exception {
+        if (args.length != 2) {
+            System.err.println("Usage: java JarBatchRunner.java <jar> <manifest>");
+            System.exit(2);
+        }
+        File jar = new File(args[0]);
+        List<URL> urls = new ArrayList<>();
+        urls.add(jar.toURI().toURL());
+        String mainClassName;
+
+        try (JarFile jarFile = new JarFile(jar)) {
+            Attributes attributes = jarFile.getManifest().getMainAttributes();
+            mainClassName = attributes.getValue("Rsrc-Main-Class");
+            if (mainClassName == null) {
+                mainClassName = attributes.getValue("Main-Class");
+            } else {
+                Path libFolder = Files.createTempDirectory("jarbatch");
+                libFolder.toFile().deleteOnExit();
+                String classPath = attributes.getValue("Rsrc-Class-Path");
+                for (String entryName : classPath == null ? new String[0] : classPath.trim().split("\\s+")) {
+                    JarEntry entry = jarFile.getJarEntry(entryName);
+                    if (!entryName.endsWith(".jar") || entry == null) {
+                        continue;
+                    }
+                    Path lib = libFolder.resolve(Paths.get(entryName).getFileName().toString());
+                    try (InputStream in = jarFile.getInputStream(entry)) {
+                        Files.copy(in, lib, StandardCopyOption.REPLACE_EXISTING);
+                    }
+                    lib.toFile().deleteOnExit();
+                    urls.add(lib.toUri().toURL());
+                }
+            }
+        }
+
+        ClassLoader loader = new URLClassLoader(urls.toArray(new URL[0]), JarBatchRunner.class.getClassLoader());
+        Thread.currentThread().setContextClassLoader(loader);
+        Method main = Class.forName(mainClassName, true, loader).getMethod("main", String[].class);
+
+        int failures = 0;
+        try (BufferedReader reader = Files.newBufferedReader(Paths.get(args[1]), StandardCharsets.UTF_8)) {
+            String line;
+            while ((line = reader.readLine()) != null) {
+                if (line.isEmpty()) {
+                    continue;
+                }
+                try {
+                    main.invoke(null, (Object) line.split("\t"));
+                } catch (Exception e) {
+                    // a failed run must not prevent the next ones, its output file is simply missing
+                    failures++;
+                    System.err.println("Run failed (" + line.replace('\t', ' ') + "): " + e.getCause());
+                }
+            }
+        }
+        System.exit(failures == 0 ? 0 : 1);
+    }
+}
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.cell_tracking import seg_measure, aogm, tra_measure
+
+
+class TestSegMeasure(TestCase):
+    def testMatchingRule(self):
+        ref = np.zeros([2, 1, 10, 10], dtype=np.uint16)
+        res = np.zeros([2, 1, 10, 10], dtype=np.uint16)
+        ref[0, 0, 0:4, 0:4] = 1
+        res[0, 0, 0:4, 0:3] = 7   # covers 12/16 of object 1: Jaccard 0.75
+        ref[1, 0, 5:9, 5:9] = 1
+        res[1, 0, 5:9, 5:7] = 3   # covers exactly half of object 1: no match
+        ref[1, 0, 0:2, 0:2] = 2   # missed
+        self.assertAlmostEqual(seg_measure(ref, res), 0.75 / 3)
+
+    def testNoReference(self):
+        ref = np.zeros([1, 1, 5, 5], dtype=np.uint8)
+        self.assertTrue(np.isnan(seg_measure(ref, ref)))
+
+
+class TestTraMeasure(TestCase):
+    def _division(self):
+        # track 1 (frames 0-1) divides into tracks 2 and 3 (frame 2)
+        data = np.zeros([3, 1, 10, 10], dtype=np.uint16)
+        data[0:2, 0, 2:6, 2:6] = 1
+        data[2, 0, 0:3, 0:3] = 2
+        data[2, 0, 6:9, 6:9] = 3
+        tracks = np.array([[1, 0, 1, 0], [2, 2, 2, 1], [3, 2, 2, 1]])
+        return data, tracks
+
+    def testPerfect(self):
+        data, tracks = self._division()
+        self.assertEqual(aogm(data, tracks, data, tracks), (0.0, 10 * 4 + 1.5 * 3))
+        self.assertAlmostEqual(tra_measure(data, tracks, data, tracks), 1.0)
+
+    def testErrors(self):
+        data, tracks = self._division()
+        res = data.copy()
+        res[2][res[2] == 3] = 0     # missed vertex: FN and its parent link is added
+        res[2][res[2] == 2] = 1     # child 2 continues track 1: semantics change
+        res_tracks = np.array([[1, 0, 2, 0]])
+        cost, empty_cost = aogm(data, tracks, res, res_tracks)
+        self.assertAlmostEqual(cost, 10 + 1.5 + 1)
+        self.assertAlmostEqual(tra_measure(data, tracks, res, res_tracks), 1 - 12.5 / 44.5)
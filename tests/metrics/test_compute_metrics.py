@@ -20,12 +20,21 @@
 # python test_compute_metrics.py imgs/in_prttrk imgs/ref_prttrk "PrtTrk" tmp gating_dist
 # python test_compute_metrics.py imgs/in_objtrk imgs/ref_objtrk "ObjTrk" tmp
 
+import io
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
 from os import walk
 from tempfile import TemporaryDirectory
-from unittest import TestCase
+from unittest import TestCase, mock
+
+import numpy as np
+from scipy import ndimage
 
 from biaflows.metrics import computemetrics, computemetrics_batch
+from biaflows.metrics.compute_metrics import unmatched_voxel_rate
 
 
 class TestComputeMetrics(TestCase):
@@ -47,9 +56,11 @@ class TestComputeMetrics(TestCase):
             problemclass="ObjSeg"
         )
         self.assertIsInstance(results, dict)
-        self.assertEqual(len(results), 2)
+        self.assertEqual(len(results), 4)
         self.assertIn("DC", results)
         self.assertIn("AHD", results)
+        self.assertIn("FOVL", results)
+        self.assertIn("mAP", results)
 
     def testSptCnt(self):
         results, params = self._test_metric(
@@ -61,6 +72,39 @@ class TestComputeMetrics(TestCase):
         self.assertEqual(len(results), 1)
         self.assertIn("REC", results)
 
+    def testSptCntParallel(self):
+        sequential, _ = self._test_metric(
+            infolder="imgs/in_sptcnt",
+            reffolder="imgs/ref_sptcnt",
+            problemclass="SptCnt"
+        )
+        parallel, _ = self._test_metric(
+            infolder="imgs/in_sptcnt",
+            reffolder="imgs/ref_sptcnt",
+            problemclass="SptCnt",
+            n_jobs=2
+        )
+        self.assertEqual(sequential, parallel)
+
+    def testSptCntCache(self):
+        with TemporaryDirectory() as cache_dir:
+            computed = self._test_metric(
+                infolder="imgs/in_sptcnt",
+                reffolder="imgs/ref_sptcnt",
+                problemclass="SptCnt",
+                cache_dir=cache_dir
+            )
+            # every pair is read from the cache
+            with mock.patch("biaflows.metrics.compute_metrics._computemetrics", side_effect=AssertionError):
+                cached = self._test_metric(
+                    infolder="imgs/in_sptcnt",
+                    reffolder="imgs/ref_sptcnt",
+                    problemclass="SptCnt",
+                    cache_dir=cache_dir
+                )
+        self.assertGreater(len(computed[0]["REC"]), 0)
+        self.assertEqual(computed, cached)
+
     def testPixCla(self):
         results, params = self._test_metric(
             infolder="imgs/in_pixcla",
@@ -144,3 +188,136 @@ class TestComputeMetrics(TestCase):
         self.assertEqual(len(results), 2)
         self.assertIn("SEG", results)
         self.assertIn("TRA", results)
+
+
+class TestJarBatch(TestCase):
+    METRIC_NAMES = ["TP", "FN", "FP", "RE", "PR", "F1", "RMSE"]
+
+    def _write_scores(self, args):
+        # ObjDet jar arguments: reference xml, predicted xml (whose name identifies the pair), gating distance
+        with open(args[1] + ".score.txt", "w") as f:
+            pair = os.path.basename(os.path.dirname(args[1]))
+            f.writelines("{}: {}\n".format(name, pair) for name in self.METRIC_NAMES)
+
+    def testBatchRun(self):
+        infiles = ["in_{}.tif".format(i) for i in range(5)]
+        reffiles = ["ref_{}.tif".format(i) for i in range(5)]
+        manifests = list()
+
+        def popen(command, stdout=None, stderr=None):
+            # the JVM of the second manifest fails on its first pair
+            with open(command[-1]) as f:
+                runs = [line.rstrip("\n").split("\t") for line in f]
+            manifests.append((stdout, runs))
+            for i, args in enumerate(runs):
+                if len(manifests) != 2 or i != 0:
+                    self._write_scores(args)
+            return mock.Mock()
+
+        def system(command):
+            self._write_scores(command.split(" ")[3:])
+
+        with TemporaryDirectory() as tmpfolder:
+            # score file left by an interrupted run
+            os.makedirs(os.path.join(tmpfolder, "pair_3"))
+            with open(os.path.join(tmpfolder, "pair_3", "intracks.xml.score.txt"), "w") as f:
+                f.writelines("{}: stale\n".format(name) for name in self.METRIC_NAMES)
+
+            with mock.patch("biaflows.metrics.compute_metrics.img_to_tracks"), \
+                    mock.patch("biaflows.metrics.compute_metrics.tracks_to_xml"), \
+                    mock.patch("biaflows.metrics.compute_metrics.subprocess.Popen", side_effect=popen), \
+                    mock.patch("biaflows.metrics.compute_metrics.os.system", side_effect=system) as os_system:
+                results, params = computemetrics_batch(infiles, reffiles, "ObjDet", tmpfolder, verbose=False,
+                                                       n_jobs=2, backend="external", gating_dist=3)
+            self.assertEqual(os.listdir(tmpfolder), [])
+
+        # pairs are split in n_jobs contiguous chunks, one manifest per JVM
+        self.assertEqual(len(manifests), 2)
+        self.assertEqual([len(runs) for _, runs in manifests], [3, 2])
+        self.assertTrue(all(stdout is not None for stdout, _ in manifests))
+        pairs = [os.path.basename(os.path.dirname(args[1])) for _, runs in manifests for args in runs]
+        self.assertEqual(pairs, ["pair_{}".format(i) for i in range(5)])
+        # the pair without score file is evaluated again, alone
+        self.assertEqual(os_system.call_count, 1)
+        self.assertIn(os.path.join("pair_3", "intracks.xml"), os_system.call_args[0][0])
+        self.assertEqual(results["TP"], ["pair_{}".format(i) for i in range(5)])
+        self.assertEqual(params["GATING_DIST"], [3] * 5)
+
+
+def distance_transform_uvr(pred, true, gating_dist):
+    # Former UVR formula (distance transforms of the whole volume). The distance to an empty skeleton is infinite
+    # (the distance transform of an image without background is not defined).
+    dst1 = ndimage.distance_transform_edt(pred == 0) if np.any(pred) else np.full(pred.shape, np.inf)
+    dst2 = ndimage.distance_transform_edt(true == 0) if np.any(true) else np.full(true.shape, np.inf)
+    indx = np.nonzero(np.logical_or(pred, true))
+    return (np.sum(dst1[indx] > gating_dist) + np.sum(dst2[indx] > gating_dist)) / (2 * indx[0].size)
+
+
+class TestUnmatchedVoxelRate(TestCase):
+    def _random_skeleton(self, rng, shape, n_segments):
+        skeleton = np.zeros(shape, dtype=np.uint8)
+        for _ in range(n_segments):
+            start = [rng.randint(size) for size in shape]
+            axis = rng.randint(len(shape))
+            end = min(shape[axis], start[axis] + rng.randint(2, 15))
+            index = list(start)
+            index[axis] = slice(start[axis], end)
+            skeleton[tuple(index)] = 1
+        return skeleton
+
+    def testSameAsDistanceTransform(self):
+        rng = np.random.RandomState(0)
+        for shape in [(40, 50), (6, 30, 30)]:
+            for gating_dist in [0, 1, 2.5, 5]:
+                pred = self._random_skeleton(rng, shape, 6)
+                true = self._random_skeleton(rng, shape, 6)
+                self.assertAlmostEqual(unmatched_voxel_rate(pred, true, gating_dist),
+                                       distance_transform_uvr(pred, true, gating_dist))
+
+    def testGatingDistanceZero(self):
+        pred, true = np.zeros((5, 5), dtype=np.uint8), np.zeros((5, 5), dtype=np.uint8)
+        pred[1, 0:4] = 1
+        true[1, 2:5] = 1
+        # 5 union voxels, 2 only in pred and 1 only in true
+        self.assertAlmostEqual(unmatched_voxel_rate(pred, true, 0), 3 / 10)
+        self.assertAlmostEqual(unmatched_voxel_rate(pred, true, 0), distance_transform_uvr(pred, true, 0))
+
+    def testEmptyPrediction(self):
+        pred, true = np.zeros((10, 10), dtype=np.uint8), np.zeros((10, 10), dtype=np.uint8)
+        true[2, 2:8] = 1
+        self.assertAlmostEqual(unmatched_voxel_rate(pred, true, 5), 0.5)
+        self.assertAlmostEqual(unmatched_voxel_rate(pred, true, 5), distance_transform_uvr(pred, true, 5))
+        self.assertTrue(np.isnan(unmatched_voxel_rate(pred, pred, 5)))
+
+
+class TestVerbose(TestCase):
+    @staticmethod
+    def _fake_computemetrics(infile, reffile, problemclass, tmpfolder, **extra_params):
+        print("computing", infile)
+        print("warning", infile, file=sys.stderr)
+        time.sleep(0.01)
+        return {"IN": infile}, {"REF": reffile}
+
+    def _run(self, verbose, **batch_params):
+        infiles = ["in_{}.tif".format(i) for i in range(8)]
+        reffiles = ["ref_{}.tif".format(i) for i in range(8)]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with TemporaryDirectory() as tmpfolder, redirect_stdout(stdout), redirect_stderr(stderr), \
+                mock.patch("biaflows.metrics.compute_metrics._computemetrics", side_effect=self._fake_computemetrics):
+            results, params = computemetrics_batch(infiles, reffiles, "SptCnt", tmpfolder, verbose=verbose, **batch_params)
+            # the streams of the caller are restored
+            self.assertIs(sys.stdout, stdout)
+            self.assertIs(sys.stderr, stderr)
+        self.assertEqual(results["IN"], infiles)
+        self.assertEqual(params["REF"], reffiles)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def testSequentialNotVerbose(self):
+        self.assertEqual(self._run(verbose=False), ("", ""))
+
+    def testThreadExecutorNotVerbose(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            stdout, stderr = self._run(verbose=False, executor=executor)
+        # output of worker threads is not redirected, thus never lost
+        self.assertEqual(stdout.count("computing"), 8)
+        self.assertEqual(stderr.count("warning"), 8)
@@ -0,0 +1,59 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+import tifffile as tiff
+
+from biaflows.metrics.img_to_seq import img_to_seq
+
+
+def baseline_img_to_seq(fname, out_dir, template, X, Y, Z, T):
+    # whole stack read at once, one frame written after another
+    img_data = tiff.imread(fname).ravel()
+    offset = Z * Y * X
+    for t in range(T):
+        tiff.imwrite(os.path.join(out_dir, template + '{0:03d}.tif'.format(t)),
+                     img_data[t * offset:(t + 1) * offset].reshape((Z, Y, X)))
+
+
+class TestImgToSeq(TestCase):
+    def _check_same_frames(self, data, X, Y, Z, T, **write_params):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "stack.tif")
+            tiff.imwrite(fname, data, **write_params)
+            expected_dir = os.path.join(tmpfolder, "expected")
+            os.makedirs(expected_dir)
+            baseline_img_to_seq(fname, expected_dir, "mask", X, Y, Z, T)
+            expected_files = sorted(os.listdir(expected_dir))
+            self.assertEqual(len(expected_files), T)
+
+            for n_threads in [1, 2, T + 3]:
+                out_dir = os.path.join(tmpfolder, "out_{}".format(n_threads))
+                os.makedirs(out_dir)
+                img_to_seq(fname, out_dir, "mask", X, Y, Z, T, n_threads=n_threads)
+                self.assertEqual(sorted(os.listdir(out_dir)), expected_files)
+                for frame_file in expected_files:
+                    frame = tiff.imread(os.path.join(out_dir, frame_file))
+                    expected = tiff.imread(os.path.join(expected_dir, frame_file))
+                    self.assertEqual(frame.dtype, expected.dtype)
+                    np.testing.assert_array_equal(frame, expected)
+
+    def testPlanePages(self):
+        # one page per (t, z) plane
+        data = np.arange(4 * 3 * 5 * 6, dtype=np.uint16).reshape((4, 3, 5, 6))
+        self._check_same_frames(data, X=6, Y=5, Z=3, T=4, photometric="minisblack")
+
+    def testFramePages(self):
+        # one page per time point (3 slices stored as separate color planes)
+        data = np.arange(4 * 3 * 5 * 6, dtype=np.uint16).reshape((4, 3, 5, 6))
+        self._check_same_frames(data, X=6, Y=5, Z=3, T=4, photometric="rgb", planarconfig="separate")
+
+    def testSingleSlice(self):
+        data = np.random.RandomState(0).randint(0, 50, size=(5, 7, 4)).astype(np.uint8)
+        self._check_same_frames(data, X=4, Y=7, Z=1, T=5)
+
+    def testWholeStack(self):
+        # a single page holding all the frames
+        data = np.arange(3 * 2 * 4 * 5, dtype=np.uint16).reshape((1, 3 * 2 * 4, 5))
+        self._check_same_frames(data, X=5, Y=4, Z=2, T=3, contiguous=True)
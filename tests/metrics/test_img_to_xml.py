@@ -0,0 +1,31 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.img_to_xml import points_to_tracks, tracks_to_xml
+
+
+class TestTracksToXml(TestCase):
+    def testTrackTable(self):
+        labels = np.array([5, 2, 5])
+        points = np.array([[0, 1, 2, 0], [0, 3, 4, 0], [1, 5, 6, 0]])
+        tracks = points_to_tracks(labels, points)
+        np.testing.assert_array_equal(tracks.labels, [2, 5])
+        np.testing.assert_array_equal(tracks.offsets, [0, 1, 3])
+        np.testing.assert_array_equal(tracks.t, [0, 0, 1])
+        np.testing.assert_array_equal(tracks.x, [3, 1, 5])
+
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tracks.xml")
+            tracks_to_xml(fname, tracks, True)
+            with open(fname, "r") as f:
+                content = f.read()
+            self.assertEqual(content.count("<particle>"), 2)
+            self.assertIn('<particle>\n<detection t="0" x="1" y="2" z="0"/>\n<detection t="1" x="5" y="6" z="0"/>\n'
+                          '</particle>\n', content)
+
+            tracks_to_xml(fname, tracks, False)
+            with open(fname, "r") as f:
+                self.assertEqual(f.read().count("<particle>"), 3)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.label_groups import coordinates_by_label, label_slice
+from biaflows.metrics.compute_metrics import landmark_errors
+
+
+class TestLabelGroups(TestCase):
+    def testCoordinatesByLabel(self):
+        img = np.zeros([5, 5], dtype=np.uint16)
+        img[0, 3] = 7
+        img[1, 1] = 2
+        img[4, 0] = 7
+        values, coords, offsets = coordinates_by_label(img)
+        np.testing.assert_array_equal(values, [2, 7])
+        np.testing.assert_array_equal(coords[label_slice(values, offsets, 7)], np.argwhere(img == 7))
+        np.testing.assert_array_equal(coords[label_slice(values, offsets, 2)], [[1, 1]])
+        self.assertEqual(coords[label_slice(values, offsets, 3)].shape[0], 0)
+
+
+class TestLandmarkErrors(TestCase):
+    def testMissingClasses(self):
+        true = np.zeros([10, 10], dtype=np.uint8)
+        pred = np.zeros([10, 10], dtype=np.uint8)
+        true[2, 2] = 1
+        pred[2, 5] = 1
+        true[8, 8] = 3  # class 2 is absent, class 3 is not predicted
+        for n_threads in [1, 2]:
+            n_ref, n_pred, errors = landmark_errors(pred, true, n_threads=n_threads)
+            np.testing.assert_array_equal(n_ref, [1, 0, 1])
+            np.testing.assert_array_equal(n_pred, [1, 0, 0])
+            self.assertAlmostEqual(errors[0], 3.0)
+            self.assertTrue(np.all(np.isnan(errors[1:])))
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.mask2model import skl2swc
+
+
+class TestSkl2Swc(TestCase):
+    def testTree(self):
+        # horizontal branch with two vertical branches
+        skeleton = np.zeros((1, 20, 30), dtype=np.uint8)
+        skeleton[0, 10, 2:28] = 1
+        skeleton[0, 2:10, 8] = 1
+        skeleton[0, 11:18, 20] = 1
+        swc = skl2swc(skeleton, smp=2)
+        np.testing.assert_array_equal(swc["id"], np.arange(1, swc.size + 1))
+        self.assertEqual(swc["parent"][0], -1)
+        # parents come first, all the branches are attached to the root
+        self.assertTrue(np.all(swc["parent"][1:] < swc["id"][1:]))
+        self.assertTrue(np.all(swc["parent"][1:] >= 1))
+        ends = {(x, y) for x, y in zip(swc["x"], swc["y"])}
+        self.assertTrue({(2, 10), (27, 10), (8, 2), (20, 17)} <= ends)
+
+    def testMoreThanOneSkeleton(self):
+        skeleton = np.zeros((1, 20, 20), dtype=np.uint8)
+        skeleton[0, 5, 2:15] = 1
+        skeleton[0, 12, 2:15] = 1
+        with self.assertRaises(ValueError):
+            skl2swc(skeleton)
+
+    def testLoop(self):
+        skeleton = np.zeros((1, 20, 20), dtype=np.uint8)
+        skeleton[0, 5, 2:15] = 1
+        skeleton[0, 12, 2:15] = 1
+        skeleton[0, 5:13, 2] = 1
+        skeleton[0, 5:13, 14] = 1
+        with self.assertRaises(ValueError):
+            skl2swc(skeleton)
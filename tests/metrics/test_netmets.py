@@ -0,0 +1,98 @@
+import os
+import struct
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from biaflows.metrics.netmets_obj import NWT, linesegment, sample_segments, netmets_obj, nearest_distances
+from biaflows.metrics.obj_io import write_obj
+from biaflows.metrics.swc2obj import swc2graph
+
+
+class TestSampleSegments(TestCase):
+    def testSameAsLineSegments(self):
+        p0 = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0], [2.0, 0.0, 0.0]])
+        p1 = np.array([[3.0, 4.0, 0.0], [1.0, 1.0, 1.0], [2.0, 0.5, 0.0]])
+        expected = np.concatenate([linesegment(a, b).pointcloud(2.0) for a, b in zip(p0, p1)])
+        samples = sample_segments(p0, p1, 2.0)
+        self.assertEqual(samples.shape, (4 + 2 + 2, 3))
+        np.testing.assert_allclose(samples, expected)
+
+
+class TestNearestDistances(TestCase):
+    def testChunkedQuery(self):
+        rng = np.random.RandomState(0)
+        tree_points, points = rng.rand(200, 3) * 10, rng.rand(1000, 3) * 12
+        expected = cKDTree(tree_points).query(points)[0]
+        with mock.patch("biaflows.metrics.netmets_obj.QUERY_CHUNK_SIZE", 64):
+            dist = nearest_distances(cKDTree(tree_points), points, 1.0, n_threads=3)
+        self.assertEqual(dist.dtype, np.float32)
+        np.testing.assert_allclose(dist[expected < 1.0], expected[expected < 1.0], rtol=1e-6)
+        self.assertTrue(np.all(np.isinf(dist[expected > 1.0])))
+
+
+class TestNWT(TestCase):
+    def testLoadNwt(self):
+        # two vertices linked by an edge defined by two points (position and radius)
+        buffer = b"nwtfileformat " + b" " * 58 + struct.pack("II", 2, 1)
+        buffer += struct.pack("fffII", 0, 0, 0, 1, 0) + struct.pack("I", 0)
+        buffer += struct.pack("fffII", 9, 0, 0, 0, 1) + struct.pack("I", 0)
+        buffer += struct.pack("III", 0, 1, 2) + struct.pack("ffffffff", 3, 1, 0, 0.5, 6, 1, 0, 0.5)
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "network.nwt")
+            with open(fname, "wb") as f:
+                f.write(buffer)
+            network = NWT(fname)
+        np.testing.assert_array_equal(network.vertices, [[0, 0, 0], [9, 0, 0]])
+        np.testing.assert_array_equal(network.edge_vertices, [[0, 1]])
+        np.testing.assert_array_equal(network.edge_points, [[3, 1, 0], [6, 1, 0]])
+        self.assertEqual(network.v[0].Eout, [0])
+        self.assertEqual(len(network.linesegments()), 3)
+
+    def testLoadObj(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "network.obj")
+            with open(fname, "w") as f:
+                f.write("v 0 0 0\nv 1 0 0\nv 2 0 0\nv 2 1 0\nl 1 2 3\nl 3 4\n")
+            network = NWT(fname)
+        np.testing.assert_array_equal(network.vertices, [[0, 0, 0], [2, 0, 0], [2, 1, 0]])
+        np.testing.assert_array_equal(network.edge_vertices, [[0, 1], [1, 2]])
+        np.testing.assert_array_equal(network.edge_offsets, [0, 1, 1])
+        p0, p1 = network.segments()
+        np.testing.assert_array_equal(p0, [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+        np.testing.assert_array_equal(p1, [[1, 0, 0], [2, 0, 0], [2, 1, 0]])
+
+    def testFromGraphSameAsObj(self):
+        points = np.array([[0, 0, 0], [1, 0, 0], [5, 5, 5], [2, 0, 0], [2, 1, 0]], dtype=float)
+        lines = np.array([[0, 1], [1, 3], [4, 3]])
+        network = NWT.from_graph(points, lines)
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "network.obj")
+            write_obj(fname, points, lines)
+            expected = NWT(fname)
+        np.testing.assert_array_equal(network.vertices, expected.vertices)
+        np.testing.assert_array_equal(network.edge_vertices, expected.edge_vertices)
+        np.testing.assert_array_equal(network.edge_offsets, expected.edge_offsets)
+        self.assertEqual(netmets_obj(network, expected, 2, 4), {"FNR": 0, "FPR": 0})
+
+
+class TestSwc2Graph(TestCase):
+    def testParentLinks(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("# tree\n1 1 0 0 0 1 -1\n3 3 0 2 0 1 2\n2 3 1.5 0 0 1 1\n\n")
+            vertices, lines = swc2graph(fname)
+        np.testing.assert_array_equal(vertices, [[0, 0, 0], [1.5, 0, 0], [0, 2, 0]])
+        np.testing.assert_array_equal(lines, [[1, 0], [2, 1]])
+
+    def testMissingParent(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("1 1 0 0 0 1 -1\n2 3 1 0 0 1 1\n3 3 2 0 0 1 9\n")
+            vertices, lines = swc2graph(fname)
+        self.assertEqual(vertices.shape, (3, 3))
+        np.testing.assert_array_equal(lines, [[1, 0]])
@@ -0,0 +1,37 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.node_sorter import swc_order, swc_node_sorter
+
+
+class TestSwcOrder(TestCase):
+    def testParentsFirst(self):
+        ids = np.array([5, 3, 1, 4, 2, 7, 6])
+        parents = np.array([4, 1, -1, 2, 1, 7, 7])
+        order = swc_order(ids, parents)
+        # tree rooted at 1 (row 2) in level order, then the tree rooted at 7 (its own parent)
+        np.testing.assert_array_equal(ids[order], [1, 3, 2, 4, 5, 7, 6])
+
+    def testSparseIds(self):
+        ids = np.array([3000.5, 10.0, 2e9])
+        parents = np.array([2e9, 3000.5, -1])
+        np.testing.assert_array_equal(swc_order(ids, parents), [2, 0, 1])
+
+    def testCycle(self):
+        with self.assertRaises(ValueError):
+            swc_order(np.array([1, 2, 3]), np.array([-1, 3, 2]))
+
+
+class TestSwcNodeSorter(TestCase):
+    def testSortFile(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("3 3 2 0 0 1 2\n2 3 1 0 0 1 1\n1 1 0 0 0 1 1\n")
+            swc_node_sorter(fname)
+            swc = np.loadtxt(fname, ndmin=2)
+        np.testing.assert_array_equal(swc[:, 0], [1, 2, 3])
+        np.testing.assert_array_equal(swc[:, 6], [-1, 1, 2])
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.particle_tracking import track_detections, tracking_performance
+
+
+class TestTrackDetections(TestCase):
+    def testCentroids(self):
+        labels = np.array([4, 4, 4, 9])
+        points = np.array([[0, 1, 1, 0], [0, 3, 1, 0], [1, 5, 5, 0], [0, 8, 8, 0]])
+        tracks, detections, track_labels = track_detections(labels, points)
+        np.testing.assert_array_equal(track_labels, [4, 9])
+        np.testing.assert_array_equal(tracks, [0, 0, 1])
+        np.testing.assert_array_equal(detections, [[0, 2, 1, 0], [1, 5, 5, 0], [0, 8, 8, 0]])
+
+
+class TestTrackingPerformance(TestCase):
+    def testPairing(self):
+        # reference track 1 (3 frames) is followed by predicted track 1 with a 1 pixel offset (the last frame is
+        # missing), reference track 2 is missed and predicted track 2 is spurious
+        true_labels = np.array([1, 1, 1, 2])
+        true_points = np.array([[0, 0, 0, 0], [1, 1, 0, 0], [2, 2, 0, 0], [0, 20, 20, 0]])
+        pred_labels = np.array([1, 1, 2])
+        pred_points = np.array([[0, 0, 1, 0], [1, 1, 1, 0], [0, 40, 40, 0]])
+        scores = tracking_performance(true_labels, true_points, pred_labels, pred_points, 5)
+
+        self.assertAlmostEqual(scores["PD"], 1 + 1 + 5 + 5)
+        self.assertAlmostEqual(scores["NPSA"], 1 - 12 / 20)
+        self.assertAlmostEqual(scores["FNPSB"], (20 - 12) / (20 + 5))
+        self.assertEqual((scores["NRT"], scores["NCT"], scores["NPT"], scores["NMT"], scores["NST"]), (2, 2, 1, 1, 1))
+        self.assertEqual((scores["NRD"], scores["NCD"], scores["NPD"], scores["NMD"], scores["NSD"]), (4, 3, 2, 2, 1))
+        self.assertAlmostEqual(scores["JST"], 1 / 3)
+        self.assertAlmostEqual(scores["JSD"], 2 / 5)
+
+    def testNoPrediction(self):
+        scores = tracking_performance(np.array([1]), np.array([[0, 1, 1, 0]]), np.zeros(0), np.zeros((0, 4)), 5)
+        self.assertEqual(scores["NPT"], 0)
+        self.assertAlmostEqual(scores["NPSA"], 0)
+        self.assertEqual(scores["JSD"], 0)
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.pixel_classification import update_confusion_matrix
+
+
+def one_shot_confusion_matrix(y_true, y_pred):
+    labels = np.union1d(y_true, y_pred)
+    n = labels.size
+    codes = np.searchsorted(labels, y_true) * n + np.searchsorted(labels, y_pred)
+    return np.bincount(codes, minlength=n * n).reshape(n, n), labels
+
+
+class TestUpdateConfusionMatrix(TestCase):
+    def _check_streamed(self, chunks):
+        cm, labels = None, None
+        for y_true, y_pred in chunks:
+            cm, labels = update_confusion_matrix(cm, labels, np.asarray(y_true), np.asarray(y_pred))
+        expected_cm, expected_labels = one_shot_confusion_matrix(
+            np.concatenate([np.ravel(c[0]) for c in chunks]), np.concatenate([np.ravel(c[1]) for c in chunks])
+        )
+        np.testing.assert_array_equal(labels, expected_labels)
+        np.testing.assert_array_equal(cm, expected_cm)
+
+    def testSingleChunk(self):
+        rng = np.random.RandomState(0)
+        self._check_streamed([(rng.randint(0, 4, size=(8, 8)), rng.randint(0, 4, size=(8, 8)))])
+
+    def testClassesInLaterChunk(self):
+        rng = np.random.RandomState(1)
+        self._check_streamed([
+            (rng.randint(0, 2, size=50), rng.randint(0, 2, size=50)),
+            (rng.randint(0, 5, size=50), rng.randint(3, 7, size=50)),
+            (np.array([300, 0, 6]), np.array([0, 300, 2]))
+        ])
+
+    def testBooleanChunks(self):
+        self._check_streamed([
+            (np.array([True, False, True]), np.array([True, True, False])),
+            (np.array([False, False]), np.array([False, True]))
+        ])
+
+    def testNegativeClasses(self):
+        self._check_streamed([
+            (np.array([-10, 0]), np.array([0, -10])),
+            (np.array([1, 0]), np.array([0, 1])),
+            (np.array([-1, 2, 1]), np.array([-1, 1, 2])),
+            (np.array([2, 1, 0]), np.array([0, 1, 2]))
+        ])
+
+    def testFloatClasses(self):
+        self._check_streamed([
+            (np.array([0.5, 1.0, 0.0]), np.array([0.0, 0.5, 1.0])),
+            (np.array([1, 0, 2]), np.array([0, 2, 1]))
+        ])
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.point_matching import sparse_assignment, gated_matching, detection_performance
+
+
+class TestSparseAssignment(TestCase):
+    def testComponents(self):
+        # component {r0, r1, c0, c1}: greedy r0-c0 would prevent r1 from being matched
+        # component {r2, c2}: single edge, component {r3, c3}: positive cost
+        rows = np.array([0, 0, 1, 2, 3])
+        cols = np.array([0, 1, 0, 2, 3])
+        costs = np.array([-3.0, -2.0, -2.5, -1.0, 1.0])
+        matched = sparse_assignment(rows, cols, costs, 4, 4)
+        np.testing.assert_array_equal(matched, [1, 2, 3])
+
+
+class TestDetectionPerformance(TestCase):
+    def testGatedMatching(self):
+        true_points = np.array([[0, 10, 10], [0, 30, 30], [1, 30, 30]])
+        pred_points = np.array([[0, 12, 10], [0, 30, 35], [0, 30, 31]])
+        true_index, pred_index, dists = gated_matching(true_points, pred_points, 5)
+        np.testing.assert_array_equal(sorted(zip(true_index, pred_index)), [(0, 0), (1, 2)])
+
+        scores = detection_performance(true_points, pred_points, 5)
+        self.assertEqual((scores["TP"], scores["FN"], scores["FP"]), (2, 1, 1))
+        self.assertAlmostEqual(scores["F1"], 2 / 3)
+        self.assertAlmostEqual(scores["RMSE"], np.sqrt(2.5))
+
+    def testNoPrediction(self):
+        scores = detection_performance(np.array([[0, 1, 1]]), np.zeros((0, 3)), 5)
+        self.assertEqual((scores["TP"], scores["FN"], scores["FP"]), (0, 1, 0))
+        self.assertEqual(scores["RE"], 0)
+        self.assertTrue(np.isnan(scores["PR"]))
+        self.assertTrue(np.isnan(scores["RMSE"]))
@@ -0,0 +1,48 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from biaflows.metrics.result_cache import MetricCache
+
+
+class TestMetricCache(TestCase):
+    def _write(self, fname, content):
+        with open(fname, "wb") as f:
+            f.write(content)
+        return fname
+
+    def testKey(self):
+        with TemporaryDirectory() as tmpfolder:
+            cache = MetricCache(os.path.join(tmpfolder, "cache"))
+            infile = self._write(os.path.join(tmpfolder, "in.tif"), b"in")
+            reffile = self._write(os.path.join(tmpfolder, "ref.tif"), b"ref")
+            key = cache.key(infile, reffile, "ObjSeg", {"a": 1, "b": 2})
+            self.assertEqual(key, cache.key(infile, reffile, "ObjSeg", {"b": 2, "a": 1}))
+            self.assertNotEqual(key, cache.key(reffile, infile, "ObjSeg", {"a": 1, "b": 2}))
+            self.assertNotEqual(key, cache.key(infile, reffile, "SptCnt", {"a": 1, "b": 2}))
+            self.assertNotEqual(key, cache.key(infile, reffile, "ObjSeg", {"a": 1}))
+            self.assertNotEqual(key, cache.key([infile, infile], reffile, "ObjSeg", {"a": 1, "b": 2}))
+            self._write(infile, b"in2")
+            self.assertNotEqual(key, cache.key(infile, reffile, "ObjSeg", {"a": 1, "b": 2}))
+
+    def testGetPut(self):
+        with TemporaryDirectory() as tmpfolder:
+            cache = MetricCache(tmpfolder)
+            self.assertIsNone(cache.get("missing"))
+            cache.put("entry", ({"DC": 0.5}, {}))
+            self.assertEqual(cache.get("entry"), ({"DC": 0.5}, {}))
+
+    def testEviction(self):
+        with TemporaryDirectory() as tmpfolder:
+            cache = MetricCache(tmpfolder, max_size=10 ** 9)
+            for i, key in enumerate(["a", "b", "c"]):
+                cache.put(key, ({"X": "x" * 1000}, {}))
+                os.utime(os.path.join(tmpfolder, key + ".pkl"), (time.time() - 100 + i, time.time() - 100 + i))
+            # reading "a" makes "b" the least recently used entry
+            cache.get("a")
+            cache.max_size = 2500
+            cache.evict()
+            self.assertIsNone(cache.get("b"))
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNotNone(cache.get("c"))
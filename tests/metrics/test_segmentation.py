@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.segmentation import canonical_labels, dice_coefficient, average_hausdorff_distance, label_overlap, overlap_iou, \
+    overlap_fraction, average_precision_records
+
+
+class TestDiceHausdorff(TestCase):
+    def testIdentical(self):
+        mask = np.zeros([20, 20], dtype=bool)
+        mask[5:10, 5:12] = True
+        self.assertAlmostEqual(dice_coefficient(mask, mask), 1.0)
+        self.assertAlmostEqual(average_hausdorff_distance(mask, mask), 0.0)
+
+    def testShifted(self):
+        gt = np.zeros([20, 20], dtype=bool)
+        gt[5:10, 5:10] = True
+        out = np.roll(gt, 2, axis=1)
+        self.assertAlmostEqual(dice_coefficient(gt, out), 0.6)
+        # 10 out of 25 pixels are 1 and 2 pixels away from the other mask
+        self.assertAlmostEqual(average_hausdorff_distance(gt, out), 15 / 25)
+
+    def testOneMaskEmpty(self):
+        gt = np.zeros([20, 20], dtype=bool)
+        out = np.zeros([20, 20], dtype=bool)
+        out[2:4, 2:4] = True
+        self.assertEqual(dice_coefficient(gt, out), 0.0)
+        self.assertTrue(np.isnan(average_hausdorff_distance(gt, out)))
+        self.assertEqual(dice_coefficient(out, gt), 0.0)
+        self.assertTrue(np.isnan(average_hausdorff_distance(out, gt)))
+
+    def testBothMasksEmpty(self):
+        gt = np.zeros([20, 20], dtype=bool)
+        out = np.zeros([20, 20], dtype=np.uint8)
+        self.assertEqual(dice_coefficient(gt, out), 0.0)
+        self.assertTrue(np.isnan(average_hausdorff_distance(gt, out)))
+
+
+class TestCanonicalLabels(TestCase):
+    def testBinaryMask(self):
+        mask = np.zeros([10, 10], dtype=np.uint8)
+        mask[0:2, 0:2] = 255
+        mask[5:7, 5:7] = 255
+        labels = canonical_labels(mask)
+        self.assertEqual(labels.dtype, np.uint8)
+        np.testing.assert_array_equal(np.unique(labels), [0, 1, 2])
+
+    def testLargeLabelValues(self):
+        image = np.zeros([10, 10], dtype=np.uint32)
+        image[0:2, 0:2] = 4000000000
+        image[0:2, 2:4] = 17  # touching objects must not be merged
+        labels = canonical_labels(image)
+        self.assertEqual(labels.dtype, np.uint8)
+        self.assertEqual(labels[0, 0], 2)
+        self.assertEqual(labels[0, 2], 1)
+        self.assertEqual(labels[5, 5], 0)
+
+
+class TestLabelOverlap(TestCase):
+    def testNonContiguousLabels(self):
+        gt = np.zeros([10, 10], dtype=np.uint32)
+        gt[0:4, 0:4] = 7
+        gt[6:10, 6:10] = 4000000000
+        out = np.zeros([10, 10], dtype=np.int64)
+        out[0:4, 0:2] = 3
+        out[0:4, 2:5] = 12
+        overlap = label_overlap(gt, out)
+
+        np.testing.assert_array_equal(overlap.true_labels, [7, 4000000000])
+        np.testing.assert_array_equal(overlap.pred_labels, [3, 12])
+        np.testing.assert_array_equal(overlap.true_areas, [16, 16])
+        np.testing.assert_array_equal(overlap.pred_areas, [8, 12])
+        pairs = sorted(zip(overlap.true_index, overlap.pred_index, overlap.intersection))
+        self.assertEqual(pairs, [(0, 0, 8), (0, 1, 8)])
+        np.testing.assert_allclose(sorted(overlap_iou(overlap)), [8 / 20, 8 / 16])
+
+    def testFractionOverlap(self):
+        gt = np.zeros([10, 10], dtype=np.uint16)
+        gt[0:4, 0:4] = 5
+        gt[6:10, 6:10] = 9
+        out = np.zeros([10, 10], dtype=np.uint16)
+        out[0:4, 0:2] = 30
+        out[0:4, 2:7] = 20  # same overlap as label 30 but smaller label
+        # first object: min(8, 16) / max(20, 16), second object is missed
+        self.assertAlmostEqual(overlap_fraction(label_overlap(gt, out)), 0.2)
+
+
+class TestAveragePrecision(TestCase):
+    def testAllThresholds(self):
+        gt = np.zeros([10, 10], dtype=np.uint8)
+        gt[0:4, 0:4] = 1
+        gt[6:10, 6:10] = 2
+        out = np.zeros([10, 10], dtype=np.uint8)
+        out[0:4, 0:3] = 1  # IoU 0.75 with first object
+        out[8:10, 0:2] = 2  # spurious object
+        records = average_precision_records(label_overlap(gt, out), thresholds=[0.5, 0.7, 0.8])
+
+        np.testing.assert_array_equal(records.tp, [1, 1, 0])
+        np.testing.assert_array_equal(records.fp, [1, 1, 2])
+        np.testing.assert_array_equal(records.fn, [1, 1, 2])
+        np.testing.assert_allclose(records.official_score, [1 / 3, 1 / 3, 0], atol=1e-6)
+        np.testing.assert_allclose(records.jaccard, 0.75 / 2)
@@ -0,0 +1,21 @@
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.skl2obj import skl2graph
+
+
+class TestSkl2Graph(TestCase):
+    def testSampledBranches(self):
+        # two branches (7 and 3 voxels) joined at a junction
+        skeleton = np.zeros((1, 5, 12), dtype=np.uint8)
+        skeleton[0, 2, 0:10] = 1
+        skeleton[0, 0:2, 6] = 1
+        vertices, lines = skl2graph(skeleton, 3, 2)
+        self.assertEqual(vertices.shape[1], 3)
+        self.assertTrue(np.all(vertices[:, 2] == 0))
+        # every branch is a chain of 1 + floor(L / 3) nodes between its end points
+        self.assertEqual(lines.shape[0], vertices.shape[0] - 1)
+        ends = np.unique(lines[:, :2], return_counts=True)
+        self.assertEqual(np.sum(ends[1] == 1), 3)
+
@@ -0,0 +1,40 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from biaflows.metrics.swc_io import read_swc, write_swc
+
+
+class TestSwcIO(TestCase):
+    def testReadSkipsComments(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("# ORIGINAL_SOURCE test\n\n1 1 0.5 1 2 1.5 -1\n2 3 4 5 6 1 1  # child\n")
+            swc = read_swc(fname)
+        np.testing.assert_array_equal(swc["id"], [1, 2])
+        np.testing.assert_array_equal(swc["type"], [1, 3])
+        np.testing.assert_array_equal(swc["x"], [0.5, 4])
+        np.testing.assert_array_equal(swc["radius"], [1.5, 1])
+        np.testing.assert_array_equal(swc["parent"], [-1, 1])
+
+    def testReadExtraColumns(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("1 1 0 0 0 1 -1\n2 3 1 0 0 1 7 1\n")
+            swc = read_swc(fname)
+        np.testing.assert_array_equal(swc["parent"], [-1, 1])
+
+    def testWriteRead(self):
+        with TemporaryDirectory() as tmpfolder:
+            fname = os.path.join(tmpfolder, "tree.swc")
+            with open(fname, "w") as f:
+                f.write("1 1 0.25 1 2 1.5 -1\n2 3 4 5 6 1 1\n")
+            swc = read_swc(fname)
+            write_swc(fname, swc, header="# written\n")
+            with open(fname) as f:
+                self.assertEqual(f.read(), "# written\n1 1 0.25 1.00 2.00 1.50 -1\n2 3 4.00 5.00 6.00 1.00 1\n")
+            np.testing.assert_array_equal(read_swc(fname), swc)